@@ -11,6 +11,87 @@ from webdriver_manager.firefox import GeckoDriverManager
 from config import config
 
 
+# Walks the DOM and emits one "tag#id.class[attr=val] {text}" line per useful node,
+# indented by nesting. Much smaller than serialized HTML for the same page.
+DOM_OUTLINE_SCRIPT = """
+const KEEP_ATTRS = ['name', 'type', 'href', 'value', 'placeholder', 'for', 'title', 'alt', 'role'];
+const SKIP_TAGS = ['SCRIPT', 'STYLE', 'SVG', 'NOSCRIPT', 'TEMPLATE'];
+const out = [];
+function walk(el, depth) {
+    if (SKIP_TAGS.includes(el.tagName.toUpperCase())) return;
+    let text = '';
+    for (const n of el.childNodes) if (n.nodeType === 3) text += n.textContent;
+    text = text.replace(/\\s+/g, ' ').trim().slice(0, 80);
+    const cls = typeof el.className === 'string' ? el.className.split(/\\s+/).filter(Boolean) : [];
+    let sig = el.tagName.toLowerCase();
+    if (el.id) sig += '#' + el.id;
+    if (cls.length) sig += '.' + cls.join('.');
+    for (const a of KEEP_ATTRS) {
+        const v = el.getAttribute(a);
+        if (v) sig += '[' + a + '=' + v.slice(0, 60) + ']';
+    }
+    const keep = text || el.id || cls.length || /^(INPUT|BUTTON|A|SELECT|TEXTAREA|FORM)$/.test(el.tagName);
+    if (keep) out.push(' '.repeat(depth) + sig + (text ? ' {' + text + '}' : ''));
+    for (const c of el.children) walk(c, keep ? depth + 1 : depth);
+}
+if (document.body) walk(document.body, 0);
+return out.join('\\n');
+"""
+
+# Resolves arguments as nested getElementsByClassName scopes, returning the first match
+FAST_BY_CLASS_SCRIPT = """
+let el = document;
+for (const cls of arguments) {
+    el = el.getElementsByClassName(cls)[0];
+    if (!el) return null;
+}
+return el;
+"""
+
+# Installs window.__travianProbe(kind, args), the page queries the bot runs over and over,
+# and runs it once. Only sent when PROBE_CALL_SCRIPT finds no helper (first use per page load).
+#   'text'    -> visible text of the first selector in args[0] with any ('' if none)
+#   'links'   -> [{href, name}] for every link matching args[0]
+#   'village' -> {url, name (first text of args[0]), active_hrefs, link_count}
+PROBE_INSTALL_SCRIPT = """
+const firstText = sels => {
+    for (const sel of sels) {
+        const el = document.querySelector(sel);
+        const text = el ? el.innerText.trim() : '';
+        if (text) return text;
+    }
+    return '';
+};
+window.__travianProbe = function (kind, args) {
+    switch (kind) {
+        case 'text':
+            return firstText(args[0]);
+        case 'links':
+            return Array.from(document.querySelectorAll(args[0])).map(a => ({
+                href: a.href || '',
+                name: (a.innerText || '').trim(),
+            }));
+        case 'village':
+            return {
+                url: location.href,
+                name: firstText(args[0]),
+                active_hrefs: Array.from(document.querySelectorAll(
+                    '#sidebarBoxVillagelist .villageList li.active a, .villageList .active a')).map(a => a.href || ''),
+                link_count: document.querySelectorAll('#sidebarBoxVillagelist .villageList li a, .villageList a').length,
+            };
+    }
+    return null;
+};
+return window.__travianProbe(arguments[0], arguments[1]);
+"""
+
+# Every other probe only sends this one-liner
+PROBE_MISSING = '__no_probe__'
+PROBE_CALL_SCRIPT = f"""
+return window.__travianProbe ? window.__travianProbe(arguments[0], arguments[1]) : '{PROBE_MISSING}';
+"""
+
+
 class BrowserManager:
     """Manages the browser instance for web automation - OPTIMIZED FOR SPEED"""
 
@@ -52,8 +133,8 @@ class BrowserManager:
         # Create screenshots directory
         os.makedirs(config.screenshots_dir, exist_ok=True)
 
-        # Initialize driver
-        self.driver = webdriver.Firefox(options=firefox_options)
+        # Initialize driver - keep_alive reuses one pooled connection to geckodriver for all commands
+        self.driver = webdriver.Firefox(options=firefox_options, keep_alive=True)
         self.driver.maximize_window()
 
         # MINIMAL implicit wait for speed
@@ -100,6 +181,38 @@ class BrowserManager:
         except NoSuchElementException:
             return None
 
+    def fast_by_id(self, id_: str):
+        """Find element by ID via document.getElementById - instant, None if missing"""
+        try:
+            return self.driver.execute_script('return document.getElementById(arguments[0])', id_)
+        except Exception:
+            return None
+
+    def fast_by_class(self, *classes: str):
+        """Find first element by class via getElementsByClassName - instant, None if missing
+
+        Several classes are walked as nested scopes, so fast_by_class('villageList', 'active')
+        is the equivalent of '.villageList .active'.
+        """
+        try:
+            return self.driver.execute_script(FAST_BY_CLASS_SCRIPT, *classes)
+        except Exception:
+            return None
+
+    def probe(self, kind: str, *args):
+        """Run a window.__travianProbe query, installing the helper (same call) on first use per page"""
+        result = self.driver.execute_script(PROBE_CALL_SCRIPT, kind, list(args))
+        if result == PROBE_MISSING:
+            result = self.driver.execute_script(PROBE_INSTALL_SCRIPT, kind, list(args))
+        return result
+
+    def first_text(self, selectors: list) -> str:
+        """Text of the first selector that matches a non-empty element, in one call ('' if none)"""
+        try:
+            return self.probe('text', selectors) or ''
+        except Exception:
+            return ''
+
     def click_element(self, by: By, value: str, timeout: int = 3):
         """Find and click an element"""
         try:
@@ -129,14 +242,21 @@ class BrowserManager:
         """Get the current page source"""
         return self.driver.page_source
 
+    def get_dom_outline(self) -> str:
+        """Get a compact text outline of the current DOM (empty string on failure)"""
+        try:
+            return self.driver.execute_script(DOM_OUTLINE_SCRIPT) or ''
+        except Exception:
+            return ''
+
     @property
     def current_url(self) -> str:
         """Get current URL"""
         return self.driver.current_url
 
-    def execute_script(self, script: str):
+    def execute_script(self, script: str, *args):
         """Execute JavaScript"""
-        return self.driver.execute_script(script)
+        return self.driver.execute_script(script, *args)
 
     def wait_for_page_load(self, timeout: int = 5):
         """Wait for page to fully load"""
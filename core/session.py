@@ -227,16 +227,7 @@ class TravianSession:
 
     def get_current_village(self) -> str:
         """Get village name"""
-        try:
-            elem = self.browser.find_element_fast(By.ID, 'villageNameField')
-            if elem:
-                return elem.text
-            elem = self.browser.find_element_fast(By.ID, 'currentVillage')
-            if elem:
-                return elem.text
-        except:
-            pass
-        return "Village"
+        return self.browser.first_text(['#villageNameField', '#currentVillage']) or "Village"
 
     def navigate_to_village_overview(self):
         """Go to dorf1"""
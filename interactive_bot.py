@@ -120,6 +120,10 @@ class StopFlag:
     def should_stop(self) -> bool:
         return self.stop_event.is_set()
 
+    def wait(self, timeout: float) -> bool:
+        """Sleep up to timeout seconds, waking early on stop. Returns True if stopped."""
+        return self.stop_event.wait(timeout)
+
     def send_to_background(self):
         self.background_event.set()
 
@@ -633,10 +637,7 @@ class InteractiveBot:
                 if upgraded_this_round == 0 and not stop_flag.should_stop():
                     if not is_background:
                         print("No upgrades available, waiting 5s...")
-                    for _ in range(5):
-                        if stop_flag.should_stop():
-                            break
-                        time.sleep(1)
+                    stop_flag.wait(5)
 
         except KeyboardInterrupt:
             stop_flag.stop()
@@ -739,10 +740,7 @@ class InteractiveBot:
 
                 if upgraded_this_round == 0 and not stop_flag.should_stop():
                     print("No upgrades available, waiting 5s...")
-                    for _ in range(5):
-                        if stop_flag.should_stop():
-                            break
-                        time.sleep(1)
+                    stop_flag.wait(5)
 
         except KeyboardInterrupt:
             stop_flag.stop()
@@ -872,10 +870,7 @@ class InteractiveBot:
 
                 if upgraded_this_round == 0 and not stop_flag.should_stop():
                     print("No upgrades available, waiting 5s...")
-                    for _ in range(5):
-                        if stop_flag.should_stop():
-                            break
-                        time.sleep(1)
+                    stop_flag.wait(5)
 
         except KeyboardInterrupt:
             stop_flag.stop()
@@ -1264,11 +1259,8 @@ class InteractiveBot:
                 if stop_flag.should_stop():
                     break
 
-                # Wait with periodic stop checks
-                for _ in range(interval):
-                    if stop_flag.should_stop():
-                        break
-                    time.sleep(1)
+                # Wait, waking early on stop
+                stop_flag.wait(interval)
 
         except KeyboardInterrupt:
             stop_flag.stop()
@@ -1511,19 +1503,16 @@ class InteractiveBot:
                 total_barracks += results['total_barracks']
                 total_stable += results['total_stable']
 
-                print(f"\nCycle totals: Barracks={results['total_barracks']}, Stable={results['total_stable']}")
-                print(f"Overall totals: Barracks={total_barracks}, Stable={total_stable}")
-                print(f"{Colors.RED}[Q/S=stop]{Colors.END}")
+                print(f"\nCycle totals: Barracks={results['total_barracks']}, Stable={results['total_stable']}\n"
+                      f"Overall totals: Barracks={total_barracks}, Stable={total_stable}\n"
+                      f"{Colors.RED}[Q/S=stop]{Colors.END}")
 
                 if stop_flag.should_stop():
                     break
 
-                # Wait with periodic stop checks
+                # Wait, waking early on stop
                 print(f"Next cycle in {interval}s...")
-                for _ in range(interval):
-                    if stop_flag.should_stop():
-                        break
-                    time.sleep(1)
+                stop_flag.wait(interval)
 
         except KeyboardInterrupt:
             stop_flag.stop()
@@ -2062,12 +2051,9 @@ class InteractiveBot:
                 if stop_flag.should_stop():
                     break
 
-                # Wait with periodic stop checks
+                # Wait, waking early on stop
                 print(f"Next raid in {interval}s...")
-                for _ in range(interval):
-                    if stop_flag.should_stop():
-                        break
-                    time.sleep(1)
+                stop_flag.wait(interval)
 
         except KeyboardInterrupt:
             stop_flag.stop()
@@ -2521,6 +2507,7 @@ class InteractiveBot:
         cache_files = [
             'farm_list.json',
             'village_cache.json',
+            'villages_cache.json',
             'village_training.json',
             'bot_settings.json',
         ]
@@ -2598,6 +2585,11 @@ class InteractiveBot:
         # Clear village map cache in memory
         if choice in ["1", "2"] and hasattr(self, 'village_map'):
             self.village_map.villages = {}
+            self.village_map.invalidate()
+
+        # Forget the village list kept in memory
+        if choice in ["1", "2"] and hasattr(self, 'military'):
+            self.military.invalidate_villages_cache()
 
         print(f"\n{Colors.GREEN}✓ Cleared {deleted_count} items{Colors.END}")
         if choice in ["1", "3"]:
@@ -2717,11 +2709,8 @@ class InteractiveBot:
 
                 print(f"{Colors.RED}[Press Q/S to stop]{Colors.END}")
 
-                # Wait with periodic stop checks
-                for _ in range(self.settings['check_interval']):
-                    if stop_flag.should_stop():
-                        break
-                    time.sleep(1)
+                # Wait, waking early on stop
+                stop_flag.wait(self.settings['check_interval'])
 
         except KeyboardInterrupt:
             stop_flag.stop()
@@ -3147,10 +3136,7 @@ Keep response concise and actionable."""
                 wait_time = self.autopilot_settings['cycle_interval']
                 print(f"\n  Next cycle in {wait_time}s...")
 
-                for _ in range(wait_time):
-                    if stop_flag.should_stop():
-                        break
-                    time.sleep(1)
+                stop_flag.wait(wait_time)
 
         except KeyboardInterrupt:
             stop_flag.stop()
@@ -3721,6 +3707,7 @@ Priority mode: {self.autopilot_settings['priority']}
                 "🔄 Re-scan (force refresh)",
                 "🗑️  Clear cache",
                 "🏠 Find building by name",
+                "🌍 Scan all villages",
             ])
 
             choice = get_input()
@@ -3737,6 +3724,8 @@ Priority mode: {self.autopilot_settings['priority']}
                 self.clear_village_cache()
             elif choice == "5":
                 self.find_building()
+            elif choice == "6":
+                self.scan_all_villages()
 
     def scan_village(self, force: bool = False):
         """Scan current village"""
@@ -3745,6 +3734,15 @@ Priority mode: {self.autopilot_settings['priority']}
         self.village_map.scan_village(force=force)
         input(f"\n{Colors.CYAN}Press Enter to continue...{Colors.END}")
 
+    def scan_all_villages(self):
+        """Scan every village in parallel"""
+        clear_screen()
+        print_header("SCANNING ALL VILLAGES")
+        villages = self.military.get_all_villages()
+        scanned = self.village_map.scan_all_villages(villages)
+        print(f"\n{Colors.GREEN}✓ Scanned {scanned}/{len(villages)} village(s){Colors.END}")
+        input(f"\n{Colors.CYAN}Press Enter to continue...{Colors.END}")
+
     def view_village_summary(self):
         """View village summary"""
         clear_screen()
@@ -3779,7 +3777,7 @@ Priority mode: {self.autopilot_settings['priority']}
             clear_screen()
 
             # Task queue status
-            task_count = len(self.task_executor.queue.get_active_tasks()) if self.task_executor else 0
+            task_count = self.task_executor.queue.active_count() if self.task_executor else 0
             executor_status = "RUNNING" if (self.task_executor and self.task_executor.running) else "STOPPED"
             status_color = Colors.GREEN if executor_status == "RUNNING" else Colors.YELLOW
             task_status = f"{status_color}{executor_status}{Colors.END} ({task_count} tasks)"
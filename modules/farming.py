@@ -201,6 +201,11 @@ class FarmListManager:
         """Get only enabled farms"""
         return [f for f in self.farms.values() if f.enabled]
 
+    def has_due_raids(self) -> bool:
+        """Check if any enabled farm with troops is due (troops back / never raided)"""
+        now = time.time()
+        return any(f.enabled and f.troops and f.next_raid_at <= now for f in self.farms.values())
+
     def estimate_travel_time(self, farm: FarmTarget) -> int:
         """Estimate round-trip travel time in seconds based on distance and slowest troop speed"""
         distance = math.sqrt((farm.x - self.home_x) ** 2 + (farm.y - self.home_y) ** 2)
@@ -523,8 +528,10 @@ class FarmListManager:
             self.save_farms()
             return False
 
-    def send_all_raids(self) -> Dict:
-        """Send raids to all enabled farms"""
+    def send_all_raids(self, stop_callback=None, only_due: bool = False) -> Dict:
+        """Send raids to all enabled farms.
+        stop_callback: optional callable that returns True to stop between farms.
+        only_due: skip farms whose troops are still out (next_raid_at in the future)."""
         results = {
             'sent': 0,
             'failed': 0,
@@ -537,9 +544,18 @@ class FarmListManager:
             print("No enabled farms in the list")
             return results
 
+        if only_due:
+            now = time.time()
+            enabled_farms = [f for f in enabled_farms if f.next_raid_at <= now]
+            if not enabled_farms:
+                print("No farms due yet")
+                return results
+
         print(f"\n🎯 Sending raids to {len(enabled_farms)} farm(s)...")
 
         for farm in enabled_farms:
+            if stop_callback and stop_callback():
+                break
             if not farm.troops:
                 print(f"  ⚠ Skipping {farm.name} - no troops configured")
                 results['skipped'] += 1
@@ -6,6 +6,9 @@ import json
 from typing import Dict, List, Optional, Tuple
 from dataclasses import dataclass, asdict
 from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException, WebDriverException
 from core.browser import BrowserManager
 from modules.resources import ResourceMonitor
 from config import config
@@ -16,6 +19,78 @@ try:
 except ImportError:
     ANTHROPIC_AVAILABLE = False
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Village ID in sidebar / URL query strings (newdid=, villageId= or did=)
+_VID_RE = re.compile(r'(?:newdid|villageId|did)=(\d+)')
+
+# Sidebar village links across Travian versions, as one selector so every lookup is one query
+_SIDEBAR_LINKS_CSS = ", ".join([
+    '#sidebarBoxVillagelist .villageList li a',
+    '#sidebarBoxVillagelist a',
+    '.villageList a',
+    '.village a',
+    '#villageListLinks a',
+])
+
+# Where the current village name can appear, in priority order
+_VILLAGE_NAME_SELECTORS = ['#villageNameField', '.villageList .active', '#currentVillage', '.villageList li.active a']
+
+# Reads [value, text] of every <option> matching arguments[0] in one round-trip
+_SELECT_OPTIONS_SCRIPT = """
+return Array.from(document.querySelectorAll(arguments[0])).map(o => [o.value || '', (o.text || '').trim()]);
+"""
+
+# Clicks the sidebar entry for village arguments[0] (matched by data-did or href); false if absent
+_SIDEBAR_CLICK_SCRIPT = """
+const id = String(arguments[0]);
+const idRe = new RegExp('(?:newdid|villageId|did)=' + id + '(?!\\\\d)');
+for (const a of document.querySelectorAll(arguments[1])) {
+    const li = a.closest('li');
+    if ((li && li.dataset.did === id) || idRe.test(a.href || '')) {
+        a.click();
+        return true;
+    }
+}
+return false;
+"""
+
+# Once the page shows village arguments[0] as current (URL or active sidebar entry), returns
+# {name} using the selectors in arguments[1]; null until then
+_VILLAGE_ACTIVE_SCRIPT = """
+const id = String(arguments[0]);
+const active = new RegExp('(?:newdid|villageId|did)=' + id + '(?!\\\\d)').test(location.href)
+    || !!document.querySelector('.villageList li.active[data-did="' + id + '"]');
+if (!active) return null;
+let name = '';
+for (const sel of arguments[1]) {
+    const el = document.querySelector(sel);
+    name = el ? el.innerText.trim() : '';
+    if (name) break;
+}
+return {name: name};
+"""
+
+
+# village_id -> compiled "...={village_id}" pattern, built once per village
+_VID_VERIFY_CACHE: Dict[str, re.Pattern] = {}
+
+
+def _href_has_village(href: str, village_id: str) -> bool:
+    """Check if a link/URL points at the given village ID"""
+    # Cheap substring pre-filter before running the regex
+    if f'={village_id}' not in href:
+        return False
+    pattern = _VID_VERIFY_CACHE.get(village_id)
+    if pattern is None:
+        pattern = _VID_VERIFY_CACHE.setdefault(
+            village_id, re.compile(rf'(?:newdid|villageId|did)={re.escape(village_id)}(?!\d)'))
+    return pattern.search(href) is not None
+
 
 @dataclass
 class VillageTrainingConfig:
@@ -48,6 +123,9 @@ class MilitaryManager:
         self.resources = resource_monitor
         self.troops = {}
         self.building_cache = {}  # gid -> slot_id mapping
+        self._villages_cache: Optional[List[Dict]] = None  # Last get_all_villages() result
+        self._cache_time = 0.0
+        self._load_villages_cache()
         self.screenshots_dir = 'screenshots'
         os.makedirs(self.screenshots_dir, exist_ok=True)
 
@@ -799,73 +877,117 @@ class MilitaryManager:
     # ==================== MULTI-VILLAGE TRAINING ====================
 
     VILLAGE_CONFIG_FILE = 'village_training.json'
+    VILLAGES_CACHE_FILE = 'villages_cache.json'
+    VILLAGES_CACHE_TTL = 300  # Seconds before the village list is re-read from the game
+
+    def _load_villages_cache(self):
+        """Load the village list saved by a previous run, if still fresh and for this account"""
+        try:
+            if os.path.exists(self.VILLAGES_CACHE_FILE):
+                with open(self.VILLAGES_CACHE_FILE, 'rb') as f:
+                    buf = f.read()
+                data = orjson.loads(buf) if orjson else json.loads(buf)
+                # Another server or account has a different village list
+                if data.get('base_url') != config.base_url or data.get('username') != config.username:
+                    return
+                if time.time() - data['ts'] < self.VILLAGES_CACHE_TTL:
+                    self._villages_cache = data['villages']
+                    self._cache_time = data['ts']
+        except:
+            pass
+
+    def _save_villages_cache(self):
+        """Persist the village list with its timestamp and account (atomically)"""
+        data = {
+            'ts': self._cache_time,
+            'base_url': config.base_url,
+            'username': config.username,
+            'villages': self._villages_cache,
+        }
+        tmp_file = f"{self.VILLAGES_CACHE_FILE}.tmp"
+        try:
+            if orjson:
+                buf = orjson.dumps(data, option=orjson.OPT_INDENT_2)
+            else:
+                buf = json.dumps(data, indent=2).encode()
+            with open(tmp_file, 'wb') as f:
+                f.write(buf)
+            os.replace(tmp_file, self.VILLAGES_CACHE_FILE)
+        except:
+            pass
+
+    def invalidate_villages_cache(self):
+        """Forget the cached village list (e.g. after a failed switch)"""
+        self._villages_cache = None
+        self._cache_time = 0.0
+        try:
+            if os.path.exists(self.VILLAGES_CACHE_FILE):
+                os.remove(self.VILLAGES_CACHE_FILE)
+        except:
+            pass
 
-    def get_all_villages(self) -> List[Dict]:
-        """Get list of all villages owned by the player"""
+    def get_all_villages(self, force_refresh: bool = False) -> List[Dict]:
+        """Get list of all villages owned by the player (cached for VILLAGES_CACHE_TTL)"""
         from config import config
 
+        if (not force_refresh and self._villages_cache
+                and time.time() - self._cache_time < self.VILLAGES_CACHE_TTL):
+            return [dict(v) for v in self._villages_cache]
+
         villages = []
 
         try:
-            # Make sure we're on a page that shows the village list
-            self.browser.navigate_to(f"{config.base_url}/dorf1.php")
-            time.sleep(0.5)
-
             # Method 1: Sidebar village list — look for clickable village entries
-            # Try multiple selectors used by different Travian versions
-            selectors = [
-                '#sidebarBoxVillagelist .villageList li a',
-                '#sidebarBoxVillagelist a',
-                '.villageList a',
-                '.village a',
-                '#villageListLinks a',
-            ]
-
-            for sel in selectors:
-                village_list = self.browser.find_elements(By.CSS_SELECTOR, sel)
-                if village_list:
-                    for elem in village_list:
-                        try:
-                            href = elem.get_attribute('href') or ''
-                            name = elem.text.strip()
-                            if not name:
-                                continue
-
-                            # Extract village ID from URL (newdid or villageId or did)
-                            vid_match = re.search(r'(?:newdid|villageId|did)=(\d+)', href)
-                            if vid_match:
-                                villages.append({
-                                    'id': vid_match.group(1),
-                                    'name': name,
-                                    'href': href,
-                                    'element': elem,
-                                })
-                        except:
-                            continue
-                    if villages:
-                        break
+            # Every in-game page has the sidebar - only navigate if it's missing
+            links = self.browser.probe('links', _SIDEBAR_LINKS_CSS) or []
+            if not links:
+                self.browser.navigate_to(f"{config.base_url}/dorf1.php")
+                # Wait for the sidebar rather than a fixed delay (single-village accounts may have none)
+                try:
+                    WebDriverWait(self.browser.driver, 2, poll_frequency=0.05).until(
+                        EC.presence_of_element_located((By.CSS_SELECTOR, _SIDEBAR_LINKS_CSS))
+                    )
+                except TimeoutException:
+                    pass
+                links = self.browser.probe('links', _SIDEBAR_LINKS_CSS) or []
+
+            found: Dict[str, Dict] = {}  # village id -> entry, first link wins
+            for link in links:
+                href = link.get('href') or ''
+                name = link.get('name') or ''
+                if not name:
+                    continue
+
+                # Extract village ID from URL (newdid or villageId or did)
+                if 'did=' not in href and 'villageId=' not in href:
+                    continue
+                if vid_match := _VID_RE.search(href):
+                    vid = vid_match.group(1)
+                    found.setdefault(vid, {'id': vid, 'name': name, 'href': href})
+            villages = list(found.values())
 
             # Method 2: Try dropdown/select
             if not villages:
-                dropdown = self.browser.find_elements(By.CSS_SELECTOR, 'select option, .villageList option')
-                for opt in dropdown:
-                    try:
-                        vid = opt.get_attribute('value')
-                        name = opt.text.strip()
-                        if vid and name and vid.isdigit():
-                            villages.append({
-                                'id': vid,
-                                'name': name,
-                                'href': f"{config.base_url}/dorf1.php?newdid={vid}",
-                                'element': None,
-                            })
-                    except:
-                        continue
-
-            # Method 3: Fallback — add current village
+                options = self.browser.execute_script(
+                    _SELECT_OPTIONS_SCRIPT, 'select option, .villageList option') or []
+                for vid, name in options:
+                    if vid and name and vid.isdigit():
+                        villages.append({
+                            'id': vid,
+                            'name': name,
+                            'href': f"{config.base_url}/dorf1.php?newdid={vid}",
+                        })
+
+            if villages:
+                self._villages_cache = villages
+                self._cache_time = time.time()
+                self._save_villages_cache()
+
+            # Method 3: Fallback — add current village (not cached)
             if not villages:
                 current_name = "Main Village"
-                name_elem = self.browser.find_element_fast(By.CSS_SELECTOR, '#villageNameField, .villageName')
+                name_elem = (self.browser.fast_by_id('villageNameField')
+                             or self.browser.fast_by_class('villageName'))
                 if name_elem:
                     current_name = name_elem.text.strip() or current_name
 
@@ -873,7 +995,6 @@ class MilitaryManager:
                     'id': '0',
                     'name': current_name,
                     'href': f"{config.base_url}/dorf1.php",
-                    'element': None,
                 })
 
         except Exception as e:
@@ -886,78 +1007,106 @@ class MilitaryManager:
         from config import config
 
         try:
+            # Already in this village - skip the page load entirely (strict checks only, a wrong
+            # skip would act on the wrong village)
+            if probe := self._check_village(village_id, strict=True):
+                return self._village_switched(probe)
+
             # Method 1: Click the village link directly in the sidebar
-            selectors = [
-                '#sidebarBoxVillagelist .villageList li a',
-                '#sidebarBoxVillagelist a',
-                '.villageList a',
-                '#villageListLinks a',
-            ]
-
-            for sel in selectors:
-                links = self.browser.find_elements(By.CSS_SELECTOR, sel)
-                for link in links:
-                    try:
-                        href = link.get_attribute('href') or ''
-                        if re.search(rf'(?:newdid|villageId|did)={re.escape(village_id)}(?:\D|$)', href):
-                            link.click()
-                            time.sleep(0.5)
-                            # Verify switch
-                            if self._verify_village_switch(village_id):
-                                return True
-                    except:
-                        continue
+            try:
+                clicked = self.browser.execute_script(_SIDEBAR_CLICK_SCRIPT, village_id, _SIDEBAR_LINKS_CSS)
+            except:
+                clicked = False
+            # Verify switch as soon as the URL / active sidebar entry updates
+            if clicked and (probe := self._wait_for_village(village_id) or self._check_village(village_id)):
+                return self._village_switched(probe)
 
-            # Method 2: Direct URL with newdid
+            # Method 2: Direct URL with newdid (navigate_to blocks until the page loads)
             self.browser.navigate_to(f"{config.base_url}/dorf1.php?newdid={village_id}")
-            time.sleep(0.5)
-            if self._verify_village_switch(village_id):
-                return True
+            if probe := self._check_village(village_id):
+                return self._village_switched(probe)
 
             # Method 3: Try villageId param
             self.browser.navigate_to(f"{config.base_url}/dorf1.php?villageId={village_id}")
-            time.sleep(0.5)
-            if self._verify_village_switch(village_id):
-                return True
+            if probe := self._check_village(village_id):
+                return self._village_switched(probe)
 
             print(f"  Warning: Could not verify village switch to ID {village_id}")
+            # The village list may be out of date (village lost/renamed)
+            self.invalidate_villages_cache()
             return False
 
         except Exception as e:
             print(f"Error switching village: {e}")
             return False
 
+    def _village_switched(self, probe: Dict) -> bool:
+        """Point the village map at the village we just confirmed (no extra lookup)"""
+        if probe.get('name') and hasattr(self, 'village_map'):
+            self.village_map.set_current_village(probe['name'])
+        return True
+
+    def _wait_for_village(self, village_id: str, timeout: float = 2) -> Optional[Dict]:
+        """Poll until the URL or active sidebar entry shows the village; {name} or None on timeout"""
+        try:
+            # Scripts can fail while the old page unloads - keep polling through that
+            return WebDriverWait(self.browser.driver, timeout, poll_frequency=0.05,
+                                 ignored_exceptions=[WebDriverException]).until(
+                lambda d: d.execute_script(_VILLAGE_ACTIVE_SCRIPT, village_id, _VILLAGE_NAME_SELECTORS)
+            )
+        except TimeoutException:
+            return None
+
+    def _probe_current_village(self) -> Dict:
+        """Read everything about the current village in one script call
+
+        Returns {url, name, id, active_hrefs, link_count}; id is None if not found.
+        """
+        probe = self.browser.probe('village', _VILLAGE_NAME_SELECTORS) or {}
+        probe['id'] = None
+        for href in probe.get('active_hrefs', []) + [probe.get('url', '')]:
+            if vid_match := _VID_RE.search(href):
+                probe['id'] = vid_match.group(1)
+                break
+        return probe
+
     def _verify_village_switch(self, village_id: str) -> bool:
         """Verify that the village switch actually happened"""
+        return self._check_village(village_id) is not None
+
+    def _check_village(self, village_id: str, strict: bool = False) -> Optional[Dict]:
+        """Probe the page once; the probe if it shows village_id as current, else None
+
+        strict: only trust the URL and the active sidebar entry, skipping the page source and
+        single-village fallbacks (used before navigating, when nothing has been switched yet).
+        """
         try:
+            probe = self._probe_current_village()
+
             # Check URL for village ID
-            current_url = self.browser.driver.current_url
-            if f'newdid={village_id}' in current_url or f'villageId={village_id}' in current_url:
-                return True
+            if probe['id'] == village_id or _href_has_village(probe['url'], village_id):
+                return probe
 
             # Check if the active village in sidebar matches
-            active = self.browser.find_elements(By.CSS_SELECTOR,
-                '#sidebarBoxVillagelist .villageList li.active a, .villageList .active a')
-            for elem in active:
-                href = elem.get_attribute('href') or ''
-                if re.search(rf'(?:newdid|villageId|did)={re.escape(village_id)}(?:\D|$)', href):
-                    return True
+            if any(_href_has_village(href, village_id) for href in probe['active_hrefs']):
+                return probe
 
-            # Check page source for village ID reference
-            page_source = self.browser.driver.page_source[:5000]
-            if f'"villageId":{village_id}' in page_source or f'"did":{village_id}' in page_source:
-                return True
+            if strict:
+                return None
+
+            # Check page source for village ID reference (only read this far - it is the costly part)
+            head = self.browser.get_page_source()[:5000]
+            if re.search(rf'"(?:villageId|did)":{re.escape(village_id)}(?!\d)', head):
+                return probe
 
             # If we only have one village, it's fine
-            village_links = self.browser.find_elements(By.CSS_SELECTOR,
-                '#sidebarBoxVillagelist .villageList li a, .villageList a')
-            if len(village_links) <= 1:
-                return True
+            if probe['link_count'] <= 1:
+                return probe
 
         except:
             pass
 
-        return False
+        return None
 
     def load_village_training_configs(self) -> Dict[str, VillageTrainingConfig]:
         """Load training configurations for all villages"""
@@ -1113,8 +1262,9 @@ class MilitaryManager:
 
         return result
 
-    def multi_village_training_cycle(self, configs: Dict[str, VillageTrainingConfig]) -> Dict:
-        """Run one training cycle across all configured villages"""
+    def multi_village_training_cycle(self, configs: Dict[str, VillageTrainingConfig], stop_callback=None) -> Dict:
+        """Run one training cycle across all configured villages.
+        stop_callback: optional callable that returns True to stop between villages."""
         results = {
             'villages_trained': 0,
             'total_barracks': 0,
@@ -1122,23 +1272,30 @@ class MilitaryManager:
         }
 
         for vid, cfg in configs.items():
+            if stop_callback and stop_callback():
+                break
             if not cfg.enabled:
                 continue
 
+            # Heading goes out live so train_in_village's own output lands under it
             print(f"\n📍 {cfg.village_name}:")
             village_result = self.train_in_village(cfg)
 
+            report = []  # This village's result lines, printed in one write
             if village_result['success']:
                 results['villages_trained'] += 1
                 results['total_barracks'] += village_result['barracks_trained']
                 results['total_stable'] += village_result['stable_trained']
 
                 if village_result['barracks_trained'] > 0:
-                    print(f"   🗡️ Barracks: {village_result['barracks_trained']}x {cfg.barracks_troop_name}")
+                    report.append(f"   🗡️ Barracks: {village_result['barracks_trained']}x {cfg.barracks_troop_name}")
                 if village_result['stable_trained'] > 0:
-                    print(f"   🐴 Stable: {village_result['stable_trained']}x {cfg.stable_troop_name}")
+                    report.append(f"   🐴 Stable: {village_result['stable_trained']}x {cfg.stable_troop_name}")
             else:
-                print(f"   No troops trained")
+                report.append(f"   No troops trained")
+
+            if report:
+                print("\n".join(report))
 
         return results
 
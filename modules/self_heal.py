@@ -1,10 +1,134 @@
 import os
+import re
+import time
 import base64
 import json
+import random
 from typing import Optional, Dict, List
-from anthropic import Anthropic
+from anthropic import Anthropic, APIStatusError, APIConnectionError
+from bs4 import BeautifulSoup
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
 from config import config
 
+try:
+    import orjson as _json
+except ImportError:
+    _json = json
+
+
+# Selector type name -> Selenium locator strategy
+_BY_MAP = {
+    "id": By.ID,
+    "css": By.CSS_SELECTOR,
+    "xpath": By.XPATH,
+    "class": By.CLASS_NAME,
+    "name": By.NAME,
+    "tag": By.TAG_NAME,
+    "link_text": By.LINK_TEXT,
+    "partial_link": By.PARTIAL_LINK_TEXT,
+}
+
+# Claude API retry policy - rate limits / overloads are retried with jittered backoff
+_RETRY_STATUS_CODES = {429, 500, 502, 503, 529}
+_RETRY_ATTEMPTS = 4
+_RETRY_MAX_WAIT = 30
+
+
+# Ancestors that group related controls - relevant snippets are widened to these
+_CONTAINER_TAGS = ('form', 'table')
+_CONTAINER_CLASSES = ('container', 'contentContainer', 'boxes')
+
+
+def _find_container(tag):
+    """Walk up to the nearest <form>/<table>/container div enclosing a tag"""
+    node = tag
+    while node is not None and node.name not in ('body', '[document]'):
+        if node.name in _CONTAINER_TAGS:
+            return node
+        if node.name == 'div' and any(c in _CONTAINER_CLASSES for c in node.get('class') or []):
+            return node
+        node = node.parent
+    return tag
+
+
+def _is_ancestor(node, tag) -> bool:
+    """True if node encloses tag (identity check - Tag == compares markup)"""
+    return any(parent is node for parent in tag.parents)
+
+
+def _relevant_html(page_source: str, hint: str, budget: int = 25000, top_k: int = 5) -> str:
+    """
+    Cut a page down to the parts most relevant to a hint instead of a byte prefix.
+
+    Each element is scored by how many hint words appear in its own text and
+    attributes, then widened to its enclosing form/container. The top scoring
+    subtrees (skipping any nested inside or around one already kept) are
+    concatenated until the budget is reached.
+
+    Args:
+        page_source: Full page HTML
+        hint: Text describing what we're looking for (description, selectors, error)
+        budget: Maximum number of characters to return
+        top_k: Maximum number of subtrees to keep
+
+    Returns:
+        HTML snippet(s), or the page prefix if nothing matched
+    """
+    if len(page_source) <= budget:
+        return page_source
+
+    words = {w for w in re.split(r'[^a-z0-9]+', hint.lower()) if len(w) > 2}
+    if not words:
+        return page_source[:budget]
+
+    try:
+        soup = BeautifulSoup(page_source, 'html.parser')
+        for junk in soup(['script', 'style', 'svg']):
+            junk.decompose()
+
+        scores = {}
+        containers = {}
+        for tag in soup.find_all(True):
+            own_text = ' '.join(tag.find_all(string=True, recursive=False))
+            attrs = ' '.join(
+                ' '.join(v) if isinstance(v, list) else str(v)
+                for v in tag.attrs.values()
+            )
+            haystack = f"{tag.name} {own_text} {attrs}".lower()
+            score = sum(1 for w in words if w in haystack)
+            if score:
+                container = _find_container(tag)
+                key = id(container)
+                containers[key] = container
+                scores[key] = scores.get(key, 0) + score
+
+        if not scores:
+            return page_source[:budget]
+
+        parts = []
+        chosen = []
+        used = 0
+        for key in sorted(scores, key=scores.get, reverse=True):
+            container = containers[key]
+            # Nested containers would repeat the same markup - keep only the better-scoring one
+            if any(_is_ancestor(container, c) or _is_ancestor(c, container) for c in chosen):
+                continue
+            chosen.append(container)
+            html = str(container)
+            if used + len(html) > budget:
+                html = html[:budget - used]
+            parts.append(html)
+            used += len(html)
+            if used >= budget or len(chosen) >= top_k:
+                break
+
+        return '\n...\n'.join(parts)
+
+    except Exception:
+        return page_source[:budget]
+
 
 class SelfHealingBot:
     """AI-powered self-debugging and self-healing capabilities"""
@@ -16,7 +140,8 @@ class SelfHealingBot:
 
         if api_key and api_key != 'your_api_key_here':
             try:
-                self.client = Anthropic(api_key=api_key)
+                # _call_claude does the retrying - don't stack the SDK's own retries on top
+                self.client = Anthropic(api_key=api_key, max_retries=0)
                 print("✓ Self-healing AI initialized")
             except Exception as e:
                 print(f"⚠️  Self-healing AI could not initialize: {e}")
@@ -24,6 +149,19 @@ class SelfHealingBot:
     def is_available(self) -> bool:
         return self.client is not None
 
+    def _call_claude(self, **kwargs):
+        """Call messages.create, retrying transient API errors with exponential backoff + jitter"""
+        for attempt in range(1, _RETRY_ATTEMPTS + 1):
+            try:
+                return self.client.messages.create(**kwargs)
+            except (APIStatusError, APIConnectionError) as e:
+                status = getattr(e, 'status_code', None)
+                if attempt == _RETRY_ATTEMPTS or (status is not None and status not in _RETRY_STATUS_CODES):
+                    raise
+                delay = max(1.0, random.uniform(0, min(_RETRY_MAX_WAIT, 2 ** attempt)))
+                print(f"⚠️  Claude API unavailable ({status or 'connection error'}), retrying in {delay:.1f}s...")
+                time.sleep(delay)
+
     def analyze_page_for_selector(self,
                                    element_description: str,
                                    failed_selector: str,
@@ -43,12 +181,20 @@ class SelfHealingBot:
             return None
 
         try:
-            # Get page source
-            page_source = self.browser.get_page_source()
-
-            # Truncate if too long
-            if len(page_source) > 50000:
-                page_source = page_source[:50000] + "\n... (truncated)"
+            # Prefer the compact DOM outline; fall back to relevant raw HTML if it
+            # is unavailable or too large for the prompt budget
+            page_content = self.browser.get_dom_outline()
+            if page_content and len(page_content) <= 30000:
+                content_label = "Page structure (one node per line: tag#id.class[attr=value] {text}, indented by nesting)"
+                content_lang = "text"
+            else:
+                page_content = _relevant_html(
+                    self.browser.get_page_source(),
+                    f"{element_description} {failed_selector}",
+                    budget=30000
+                )
+                content_label = "Page HTML (partial)"
+                content_lang = "html"
 
             # Build the prompt
             prompt = f"""You are a Selenium expert debugging a web automation bot for Travian game.
@@ -58,12 +204,12 @@ The bot tried to find an element but failed.
 **Element we're looking for:** {element_description}
 **Failed selector:** {failed_selector}
 
-**Page HTML (partial):**
-```html
-{page_source[:30000]}
+**{content_label}:**
+```{content_lang}
+{page_content}
 ```
 
-Please analyze the HTML and provide:
+Please analyze the page and provide:
 1. The correct CSS selector(s) to find this element
 2. Alternative selectors (XPath, ID, class, etc.)
 3. Brief explanation of why the original selector failed
@@ -81,7 +227,7 @@ Respond in this JSON format:
 Only respond with valid JSON, no other text."""
 
             # Call Claude API
-            message = self.client.messages.create(
+            message = self._call_claude(
                 model="claude-sonnet-4-5-20250929",
                 max_tokens=1024,
                 messages=[{"role": "user", "content": prompt}]
@@ -91,15 +237,14 @@ Only respond with valid JSON, no other text."""
 
             # Parse JSON response
             try:
-                result = json.loads(response_text)
+                result = _json.loads(response_text)
                 print(f"🔧 AI found selector: {result.get('primary_selector', {}).get('value', 'unknown')}")
                 return result
             except json.JSONDecodeError:
                 # Try to extract JSON from response
-                import re
                 json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
                 if json_match:
-                    return json.loads(json_match.group())
+                    return _json.loads(json_match.group())
                 return None
 
         except Exception as e:
@@ -125,7 +270,7 @@ Only respond with valid JSON, no other text."""
             with open(screenshot_path, "rb") as f:
                 image_data = base64.standard_b64encode(f.read()).decode("utf-8")
 
-            message = self.client.messages.create(
+            message = self._call_claude(
                 model="claude-sonnet-4-5-20250929",
                 max_tokens=2048,
                 messages=[
@@ -182,6 +327,8 @@ Be specific about:
             return None
 
         try:
+            page_html = _relevant_html(page_html, error_description, budget=20000)
+
             prompt = f"""You are debugging a Travian game bot written in Python with Selenium.
 
 **Error:** {error_description}
@@ -193,7 +340,7 @@ Be specific about:
 
 **Page HTML (partial):**
 ```html
-{page_html[:20000]}
+{page_html}
 ```
 
 Analyze the issue and provide a fix. Respond in JSON:
@@ -203,7 +350,7 @@ Analyze the issue and provide a fix. Respond in JSON:
     "explanation": "Why this fixes it"
 }}"""
 
-            message = self.client.messages.create(
+            message = self._call_claude(
                 model="claude-sonnet-4-5-20250929",
                 max_tokens=2048,
                 messages=[{"role": "user", "content": prompt}]
@@ -212,12 +359,11 @@ Analyze the issue and provide a fix. Respond in JSON:
             response_text = message.content[0].text
 
             try:
-                return json.loads(response_text)
+                return _json.loads(response_text)
             except:
-                import re
                 json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
                 if json_match:
-                    return json.loads(json_match.group())
+                    return _json.loads(json_match.group())
                 return {"explanation": response_text}
 
         except Exception as e:
@@ -248,7 +394,7 @@ Provide specific actionable advice:
 
 Keep it concise and actionable."""
 
-            message = self.client.messages.create(
+            message = self._call_claude(
                 model="claude-sonnet-4-5-20250929",
                 max_tokens=1024,
                 messages=[{"role": "user", "content": prompt}]
@@ -278,27 +424,12 @@ class SmartElementFinder:
             selectors: List of selectors to try, e.g. [{"by": "id", "value": "myId"}]
             timeout: Timeout for each attempt
         """
-        from selenium.webdriver.common.by import By
-        from selenium.webdriver.support.ui import WebDriverWait
-        from selenium.webdriver.support import expected_conditions as EC
-
-        by_map = {
-            "id": By.ID,
-            "css": By.CSS_SELECTOR,
-            "xpath": By.XPATH,
-            "class": By.CLASS_NAME,
-            "name": By.NAME,
-            "tag": By.TAG_NAME,
-            "link_text": By.LINK_TEXT,
-            "partial_link": By.PARTIAL_LINK_TEXT,
-        }
-
         # Check cache first
         if description in self.selector_cache:
             cached = self.selector_cache[description]
             try:
                 element = WebDriverWait(self.browser.driver, timeout).until(
-                    EC.presence_of_element_located((by_map[cached["by"]], cached["value"]))
+                    EC.presence_of_element_located((_BY_MAP[cached["by"]], cached["value"]))
                 )
                 return element
             except:
@@ -307,7 +438,7 @@ class SmartElementFinder:
         # Try provided selectors
         for selector in selectors:
             try:
-                by = by_map.get(selector["by"], By.CSS_SELECTOR)
+                by = _BY_MAP.get(selector["by"], By.CSS_SELECTOR)
                 element = WebDriverWait(self.browser.driver, timeout).until(
                     EC.presence_of_element_located((by, selector["value"]))
                 )
@@ -327,7 +458,7 @@ class SmartElementFinder:
             if result and "primary_selector" in result:
                 try:
                     primary = result["primary_selector"]
-                    by = by_map.get(primary["by"], By.CSS_SELECTOR)
+                    by = _BY_MAP.get(primary["by"], By.CSS_SELECTOR)
                     element = WebDriverWait(self.browser.driver, timeout).until(
                         EC.presence_of_element_located((by, primary["value"]))
                     )
@@ -339,7 +470,7 @@ class SmartElementFinder:
                     # Try alternatives
                     for alt in result.get("alternatives", []):
                         try:
-                            by = by_map.get(alt["by"], By.CSS_SELECTOR)
+                            by = _BY_MAP.get(alt["by"], By.CSS_SELECTOR)
                             element = WebDriverWait(self.browser.driver, timeout).until(
                                 EC.presence_of_element_located((by, alt["value"]))
                             )
@@ -5,11 +5,22 @@ Since Selenium can only do one thing at a time, tasks run in sequence.
 
 import re
 import time
+import asyncio
+import heapq
 import threading
-from typing import Dict, List, Optional
-from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from queue import Empty, SimpleQueue
+from collections import defaultdict
+from itertools import chain
+from typing import Callable, DefaultDict, Dict, Iterator, List, Optional, Set, Tuple
+from dataclasses import dataclass, field
 from enum import Enum
 from selenium.webdriver.common.by import By
+from modules.village_map import building_slots
+
+
+# "Main Building Level 5" -> name before the match, level in group 1
+_LEVEL_RE = re.compile(r'Level\s*(\d+)')
 
 
 class TaskStatus(Enum):
@@ -21,6 +32,10 @@ class TaskStatus(Enum):
     STOPPED = "stopped"
 
 
+_ACTIVE_STATUSES = frozenset([TaskStatus.PENDING, TaskStatus.RUNNING])
+_FINISHED_STATUSES = frozenset([TaskStatus.COMPLETED, TaskStatus.STOPPED, TaskStatus.FAILED])
+
+
 @dataclass
 class Task:
     id: int
@@ -33,98 +48,248 @@ class Task:
     last_run: str = ""
     repeat: bool = True  # Should this task repeat?
     interval: int = 30  # Seconds between runs
+    # Set to interrupt this task mid-run (pause); checked between steps
+    stop_event: threading.Event = field(default_factory=threading.Event, repr=False, compare=False)
 
 
 class TaskQueue:
     """
     Manages a queue of tasks that run sequentially.
-    Tasks are executed one at a time in round-robin fashion.
+    Tasks are executed one at a time, earliest-ready first.
+
+    Changes to self.tasks and the status buckets (add/remove/pause/resume/
+    stop/clear) apply right away under self._lock, so every thread sees them.
+    Only scheduling is deferred: while the executor is running it owns the
+    ready heap, and task ids to schedule are sent to it as commands that it
+    applies in one batch before each scheduling decision.
     """
 
+    FINISHED_TASK_TTL = 300  # Seconds a completed/failed/stopped task stays listed
+
     def __init__(self):
         self.tasks: Dict[int, Task] = {}
         self.task_counter = 0
-        self.running = False
+        self.running = False  # True while an executor thread is draining commands
         self.current_task_id: Optional[int] = None
         self.stop_flag = threading.Event()
+        # Min-heap of (ready_at, task_id) using time.monotonic(). _scheduled holds
+        # each task's live entry; superseded entries and tasks that left PENDING
+        # (paused/stopped/removed) are skipped lazily when they reach the top.
+        self._heap: List[Tuple[float, int]] = []
+        self._scheduled: Dict[int, float] = {}
+        self._expiry_heap: List[Tuple[float, int]] = []  # (expire_at, task_id) of finished tasks
+        # Task ids per status, kept in sync by set_status / _add / _remove
+        self._by_status: DefaultDict[TaskStatus, Set[int]] = defaultdict(set)
+        # Guards self.tasks, the status buckets and the expiry heap across threads
+        self._lock = threading.RLock()
+        self._commands: SimpleQueue = SimpleQueue()  # Task ids waiting to be scheduled
+        self.on_change: Optional[Callable[[], None]] = None  # Called when a command is queued
+
+    def _schedule(self, task_id: int, delay: float = 0):
+        """Schedule a task to become ready after delay seconds"""
+        ready_at = time.monotonic() + delay
+        with self._lock:
+            self._scheduled[task_id] = ready_at
+            heapq.heappush(self._heap, (ready_at, task_id))
+
+    def _drop_stale(self):
+        """Pop superseded or no-longer-pending entries off the top of the heap (caller holds the lock)"""
+        while self._heap:
+            ready_at, task_id = self._heap[0]
+            task = self.tasks.get(task_id)
+            if self._scheduled.get(task_id) == ready_at and task and task.status == TaskStatus.PENDING:
+                return
+            heapq.heappop(self._heap)
+            if self._scheduled.get(task_id) == ready_at:
+                del self._scheduled[task_id]
+
+    def set_status(self, task: Task, status: TaskStatus):
+        """Change a task's status, keeping the status buckets in sync"""
+        with self._lock:
+            self._by_status[task.status].discard(task.id)
+            self._by_status[status].add(task.id)
+            task.status = status
+
+    def _add(self, task: Task):
+        """Insert a task into the store"""
+        self.tasks[task.id] = task
+        self._by_status[task.status].add(task.id)
+
+    def _remove(self, task_id: int):
+        """Delete a task from the store"""
+        task = self.tasks.pop(task_id, None)
+        if task:
+            self._by_status[task.status].discard(task_id)
+
+    def _mark_finished(self, task: Task, status: TaskStatus):
+        """Set a final status and schedule the task for automatic removal"""
+        self.set_status(task, status)
+        heapq.heappush(self._expiry_heap, (time.monotonic() + self.FINISHED_TASK_TTL, task.id))
+
+    def _expire_finished(self):
+        """Remove finished tasks whose TTL has passed"""
+        now = time.monotonic()
+        with self._lock:
+            while self._expiry_heap and self._expiry_heap[0][0] <= now:
+                _, task_id = heapq.heappop(self._expiry_heap)
+                task = self.tasks.get(task_id)
+                if task and task.status in _FINISHED_STATUSES:
+                    self._remove(task_id)
+
+    # ==================== COMMANDS ====================
+
+    def _request_schedule(self, task_id: int):
+        """Make a task ready now - via the executor if one is running, else right away"""
+        self._commands.put(task_id)
+        if not self.running:
+            self.drain_commands()
+        elif self.on_change:
+            self.on_change()
+
+    def drain_commands(self) -> int:
+        """Schedule all queued task ids in one batch. Returns the number applied."""
+        count = 0
+        while True:
+            try:
+                task_id = self._commands.get_nowait()
+            except Empty:
+                return count
+            self._schedule(task_id)
+            count += 1
 
     def add_task(self, name: str, task_type: str, config: Dict, repeat: bool = True, interval: int = 30) -> int:
         """Add a new task to the queue"""
-        self.task_counter += 1
-        task = Task(
-            id=self.task_counter,
-            name=name,
-            task_type=task_type,
-            config=config,
-            created_at=time.strftime('%H:%M:%S'),
-            repeat=repeat,
-            interval=interval
-        )
-        self.tasks[task.id] = task
+        with self._lock:
+            self.task_counter += 1
+            task = Task(
+                id=self.task_counter,
+                name=name,
+                task_type=task_type,
+                config=config,
+                created_at=time.strftime('%H:%M:%S'),
+                repeat=repeat,
+                interval=interval
+            )
+            self._add(task)
+        self._request_schedule(task.id)
         print(f"✓ Task #{task.id} added: {name}")
         return task.id
 
     def remove_task(self, task_id: int) -> bool:
         """Remove a task from the queue"""
-        if task_id in self.tasks:
-            del self.tasks[task_id]
-            return True
-        return False
+        with self._lock:
+            task = self.tasks.get(task_id)
+            if not task:
+                return False
+            task.stop_event.set()  # Interrupt it if it is currently running
+            self._remove(task_id)
+        return True
 
     def pause_task(self, task_id: int) -> bool:
-        """Pause a task"""
-        if task_id in self.tasks:
-            self.tasks[task_id].status = TaskStatus.PAUSED
-            return True
-        return False
+        """Pause a task (interrupts it if it is currently running)"""
+        with self._lock:
+            task = self.tasks.get(task_id)
+            if not task:
+                return False
+            task.stop_event.set()
+            self.set_status(task, TaskStatus.PAUSED)
+        return True
 
     def resume_task(self, task_id: int) -> bool:
         """Resume a paused task"""
-        if task_id in self.tasks and self.tasks[task_id].status == TaskStatus.PAUSED:
-            self.tasks[task_id].status = TaskStatus.PENDING
-            return True
-        return False
+        with self._lock:
+            task = self.tasks.get(task_id)
+            if not task or task.status != TaskStatus.PAUSED:
+                return False
+            self.set_status(task, TaskStatus.PENDING)
+            task.stop_event.clear()
+        self._request_schedule(task_id)
+        return True
 
     def get_next_task(self) -> Optional[Task]:
-        """Get the next pending task to run"""
-        for task_id, task in self.tasks.items():
-            if task.status == TaskStatus.PENDING:
+        """Get the earliest pending task that is ready to run, marked RUNNING"""
+        self.drain_commands()
+        self._expire_finished()
+        with self._lock:
+            self._drop_stale()
+            if self._heap and self._heap[0][0] <= time.monotonic():
+                _, task_id = heapq.heappop(self._heap)
+                del self._scheduled[task_id]
+                task = self.tasks[task_id]
+                # Claimed under the lock, so a pause/remove can't slip in before it starts
+                self.set_status(task, TaskStatus.RUNNING)
                 return task
         return None
 
+    def seconds_until_next(self) -> Optional[float]:
+        """Seconds until the next pending task is ready (None if nothing is scheduled)"""
+        with self._lock:
+            self._drop_stale()
+            if not self._heap:
+                return None
+            return max(0.0, self._heap[0][0] - time.monotonic())
+
     def get_all_tasks(self) -> List[Task]:
         """Get all tasks"""
-        return list(self.tasks.values())
+        if not self.running:
+            self._expire_finished()
+        with self._lock:
+            return list(self.tasks.values())
 
     def get_active_tasks(self) -> List[Task]:
-        """Get tasks that are pending or running"""
-        return [t for t in self.tasks.values() if t.status in [TaskStatus.PENDING, TaskStatus.RUNNING]]
+        """Get tasks that are pending or running, in creation order"""
+        return sorted(self.get_active_tasks_iter(), key=lambda task: task.id)
+
+    def get_active_tasks_iter(self) -> Iterator[Task]:
+        """Iterate tasks that are pending or running (in no particular order)"""
+        with self._lock:
+            # Snapshot - the selenium worker changes statuses while the executor runs
+            tasks = tuple(filter(None, map(self.tasks.get, self._active_id_iter())))
+        return iter(tasks)
+
+    def active_count(self) -> int:
+        """Number of pending/running tasks, straight from the status buckets"""
+        with self._lock:
+            return len(self._by_status[TaskStatus.PENDING]) + len(self._by_status[TaskStatus.RUNNING])
+
+    def _active_id_iter(self) -> Iterator[int]:
+        """Ids of pending/running tasks, read live from the status buckets (caller holds the lock)"""
+        return chain(self._by_status[TaskStatus.PENDING], self._by_status[TaskStatus.RUNNING])
 
     def stop_all(self):
         """Stop all tasks"""
         self.stop_flag.set()
-        for task in self.tasks.values():
-            if task.status in [TaskStatus.PENDING, TaskStatus.RUNNING]:
-                task.status = TaskStatus.STOPPED
+        with self._lock:
+            # Snapshot - finishing a task moves it out of the buckets being read
+            for task_id in list(self._active_id_iter()):
+                self._mark_finished(self.tasks[task_id], TaskStatus.STOPPED)
 
     def clear_completed(self):
         """Remove completed/stopped tasks"""
-        to_remove = [tid for tid, t in self.tasks.items()
-                     if t.status in [TaskStatus.COMPLETED, TaskStatus.STOPPED, TaskStatus.FAILED]]
-        for tid in to_remove:
-            del self.tasks[tid]
+        with self._lock:
+            for status in _FINISHED_STATUSES:
+                for task_id in list(self._by_status[status]):
+                    self._remove(task_id)
 
     def mark_task_done(self, task_id: int, success: bool = True):
         """Mark a task run as complete"""
-        if task_id in self.tasks:
-            task = self.tasks[task_id]
+        with self._lock:
+            task = self.tasks.get(task_id)
+            if not task:
+                return
             task.runs += 1
             task.last_run = time.strftime('%H:%M:%S')
 
+            # Paused or stopped while it ran - keep that status
+            if task.status != TaskStatus.RUNNING:
+                return
+
             if task.repeat:
-                task.status = TaskStatus.PENDING
+                self.set_status(task, TaskStatus.PENDING)
+                # Ready again once its interval has passed
+                self._schedule(task_id, task.interval)
             else:
-                task.status = TaskStatus.COMPLETED if success else TaskStatus.FAILED
+                self._mark_finished(task, TaskStatus.COMPLETED if success else TaskStatus.FAILED)
 
 
 class TaskExecutor:
@@ -137,6 +302,17 @@ class TaskExecutor:
         self.queue = TaskQueue()
         self.running = False
         self.thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._selenium_pool: Optional[ThreadPoolExecutor] = None
+        self._current_task: Optional[Task] = None
+        self._async_wake: Optional[asyncio.Event] = None
+        self.queue.on_change = self._wake
+        self.refresh_modules()
+
+    def refresh_modules(self):
+        """Re-check which optional bot modules are available (call if attached later)"""
+        self._has_farming = getattr(self.bot, 'farming', None) is not None
+        self._has_military = getattr(self.bot, 'military', None) is not None
 
     def add_train_task(self, building: str, troop_name: str, troop_input: str, interval: int = 30) -> int:
         """Add a troop training task"""
@@ -197,9 +373,14 @@ class TaskExecutor:
             interval=interval
         )
 
+    def _should_stop(self) -> bool:
+        """Cancellation checkpoint - True once the executor or the current task is stopped"""
+        task = self._current_task
+        return self.queue.stop_flag.is_set() or (task is not None and task.stop_event.is_set())
+
     def execute_task(self, task: Task) -> bool:
-        """Execute a single task"""
-        task.status = TaskStatus.RUNNING
+        """Execute a single task (already marked RUNNING by get_next_task)"""
+        self._current_task = task
         success = False
 
         try:
@@ -219,6 +400,7 @@ class TaskExecutor:
             print(f"  Task error: {e}")
             success = False
 
+        self._current_task = None
         self.queue.mark_task_done(task.id, success)
         return success
 
@@ -251,6 +433,8 @@ class TaskExecutor:
 
         # Try to upgrade one field
         for field_id in field_ids:
+            if self._should_stop():
+                return False
             self.bot.buildings.navigate_to_building(field_id)
 
             # Get current level
@@ -260,11 +444,10 @@ class TaskExecutor:
 
             if h1:
                 text = h1.text
-                if 'Level' in text:
-                    name = text.split('Level')[0].strip()
-                    match = re.search(r'Level\s*(\d+)', text)
-                    if match:
-                        current_level = int(match.group(1))
+                match = _LEVEL_RE.search(text)
+                if match:
+                    name = text[:match.start()].strip()
+                    current_level = int(match.group(1))
 
             # Skip if already at target level
             if current_level >= target_level:
@@ -272,24 +455,65 @@ class TaskExecutor:
 
             # Try to click upgrade
             try:
-                upgrade_btn = self.bot.browser.find_element_fast(By.CSS_SELECTOR, 'button.build')
+                # Disabled buttons are excluded by the selector - no class lookup needed
+                upgrade_btn = self.bot.browser.find_element_fast(By.CSS_SELECTOR, 'button.build:not(.disabled)')
                 if upgrade_btn:
-                    btn_class = upgrade_btn.get_attribute('class') or ''
-                    if 'disabled' not in btn_class:
-                        print(f"  🔨 {name} L{current_level} -> L{current_level + 1}")
-                        upgrade_btn.click()
-                        return True
+                    print(f"  🔨 {name} L{current_level} -> L{current_level + 1}")
+                    upgrade_btn.click()
+                    return True
             except:
                 pass
 
         return False
 
+    def _scan_village_buildings(self) -> List[Dict]:
+        """Read id/gid/name/level of all village building slots by parsing the dorf2.php page source"""
+        from config import config as bot_config
+
+        try:
+            self.bot.browser.navigate_to(f"{bot_config.base_url}/dorf2.php")
+            slots = building_slots(self.bot.browser.get_page_source())
+        except Exception as e:
+            print(f"  Could not read village overview: {e}")
+            return []
+
+        return [s for s in slots if 19 <= s['id'] <= 40]
+
     def _execute_village_upgrade(self, config: Dict) -> bool:
         """Execute village building upgrade task - upgrades ONE building per run"""
         target_level = config['target_level']
 
+        slots = self._scan_village_buildings()
+        if not slots:
+            # Overview layout not recognised - scan slot by slot
+            return self._execute_village_upgrade_per_slot(target_level)
+
+        # Only visit buildings that exist and are below the target level
+        for slot in slots:
+            if self._should_stop():
+                return False
+            name = slot['name'] or f"Building #{slot['id']}"
+            if not slot['gid'] or name in ['Empty', 'Unknown'] or slot['level'] >= target_level:
+                continue
+
+            self.bot.buildings.navigate_to_building(slot['id'])
+            try:
+                upgrade_btn = self.bot.browser.find_element_fast(By.CSS_SELECTOR, 'button.build:not(.disabled)')
+                if upgrade_btn:
+                    print(f"  🏗️ {name} L{slot['level']} -> L{slot['level'] + 1}")
+                    upgrade_btn.click()
+                    return True
+            except:
+                pass
+
+        return False
+
+    def _execute_village_upgrade_per_slot(self, target_level: int) -> bool:
+        """Fallback: visit every village slot (19-40) to find one to upgrade"""
         # Scan and try to upgrade village buildings (19-40)
         for building_id in range(19, 41):
+            if self._should_stop():
+                return False
             self.bot.buildings.navigate_to_building(building_id)
 
             # Get current level and name
@@ -299,11 +523,10 @@ class TaskExecutor:
 
             if h1:
                 text = h1.text
-                if 'Level' in text:
-                    name = text.split('Level')[0].strip()
-                    match = re.search(r'Level\s*(\d+)', text)
-                    if match:
-                        current_level = int(match.group(1))
+                match = _LEVEL_RE.search(text)
+                if match:
+                    name = text[:match.start()].strip()
+                    current_level = int(match.group(1))
                 elif text.strip() and 'Construct' not in text:
                     name = text.strip()
 
@@ -315,22 +538,26 @@ class TaskExecutor:
 
             # Try to click upgrade
             try:
-                upgrade_btn = self.bot.browser.find_element_fast(By.CSS_SELECTOR, 'button.build')
+                # Disabled buttons are excluded by the selector - no class lookup needed
+                upgrade_btn = self.bot.browser.find_element_fast(By.CSS_SELECTOR, 'button.build:not(.disabled)')
                 if upgrade_btn:
-                    btn_class = upgrade_btn.get_attribute('class') or ''
-                    if 'disabled' not in btn_class:
-                        print(f"  🏗️ {name} L{current_level} -> L{current_level + 1}")
-                        upgrade_btn.click()
-                        return True
+                    print(f"  🏗️ {name} L{current_level} -> L{current_level + 1}")
+                    upgrade_btn.click()
+                    return True
             except:
                 pass
 
         return False
 
     def _execute_farm(self, config: Dict) -> bool:
-        """Execute farming task - send raids to all enabled farms"""
-        if hasattr(self.bot, 'farming') and self.bot.farming:
-            results = self.bot.farming.send_all_raids()
+        """Execute farming task - send raids to the enabled farms that are due"""
+        if self._has_farming:
+            # Skip the rally point round-trip while every farm's troops are still out
+            if not self.bot.farming.has_due_raids():
+                print("  No farms due yet")
+                return False
+            # Only the farms counted as due above - the rest still have troops out
+            results = self.bot.farming.send_all_raids(stop_callback=self._should_stop, only_due=True)
             return results['sent'] > 0
         else:
             print("  ✗ Farming module not initialized")
@@ -338,40 +565,66 @@ class TaskExecutor:
 
     def _execute_multi_village_train(self, config: Dict) -> bool:
         """Execute multi-village training task"""
-        if hasattr(self.bot, 'military') and self.bot.military:
+        if self._has_military:
             # Load training configs
             configs = self.bot.military.load_village_training_configs()
             if not configs:
                 print("  ✗ No village training configs set up")
                 return False
 
-            results = self.bot.military.multi_village_training_cycle(configs)
+            results = self.bot.military.multi_village_training_cycle(configs, stop_callback=self._should_stop)
             return results['villages_trained'] > 0
         else:
             print("  ✗ Military module not initialized")
             return False
 
-    def run_loop(self, stop_event: threading.Event):
-        """Main task execution loop"""
+    async def _run_loop_async(self, stop_event: threading.Event):
+        """Main task execution loop - sleeps exactly until the next task is due"""
+        self._loop = asyncio.get_running_loop()
+        if hasattr(asyncio, 'eager_task_factory'):  # Python 3.12+
+            self._loop.set_task_factory(asyncio.eager_task_factory)
+        self._async_wake = asyncio.Event()
         print("\n🔄 Task executor started")
 
-        while not stop_event.is_set():
-            task = self.queue.get_next_task()
-
-            if task:
-                print(f"\n⏳ Running: {task.name}")
-                self.execute_task(task)
-
-                # Wait the task's interval before it can run again
-                for _ in range(task.interval):
-                    if stop_event.is_set():
-                        break
-                    time.sleep(1)
-            else:
-                # No tasks ready, wait a bit
-                time.sleep(1)
+        try:
+            while not stop_event.is_set():
+                task = self.queue.get_next_task()
+
+                if task:
+                    print(f"\n⏳ Running: {task.name}")
+                    await self._execute_task_async(task)
+                    continue
+
+                # Nothing ready - wait until the earliest task is due, a new task is
+                # added or the executor is stopped
+                try:
+                    await asyncio.wait_for(self._async_wake.wait(), timeout=self.queue.seconds_until_next())
+                except asyncio.TimeoutError:
+                    pass
+                self._async_wake.clear()
+        finally:
+            self._loop = None
+            # Hand scheduling back to the caller threads, even if the loop died
+            # (unless a newer executor thread has already taken over)
+            if self.thread is None or self.thread is threading.current_thread():
+                self.queue.running = False
+                self.running = False
+                self.queue.drain_commands()
+            print("\n🛑 Task executor stopped")
+
+    async def _execute_task_async(self, task: Task) -> bool:
+        """Run a task's blocking Selenium work on the single browser worker"""
+        return await self._loop.run_in_executor(self._selenium_pool, self.execute_task, task)
 
-        print("\n🛑 Task executor stopped")
+    def run_loop(self, stop_event: threading.Event):
+        """Run the task execution loop on its own event loop (thread target)"""
+        # One worker keeps browser access serial while the loop stays responsive
+        self._selenium_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='selenium')
+        try:
+            asyncio.run(self._run_loop_async(stop_event))
+        finally:
+            self._selenium_pool.shutdown(wait=True)
+            self._selenium_pool = None
 
     def start(self) -> bool:
         """Start the task executor in a thread"""
@@ -380,6 +633,7 @@ class TaskExecutor:
 
         self.running = True
         self.queue.stop_flag.clear()
+        self.queue.running = True
         self.thread = threading.Thread(target=self.run_loop, args=(self.queue.stop_flag,), daemon=True)
         self.thread.start()
         return True
@@ -388,3 +642,14 @@ class TaskExecutor:
         """Stop the task executor"""
         self.running = False
         self.queue.stop_all()
+        # Wake the loop immediately instead of waiting out the current interval
+        self._wake()
+
+    def _wake(self):
+        """Wake the executor loop from any thread"""
+        loop = self._loop
+        if loop and self._async_wake:
+            try:
+                loop.call_soon_threadsafe(self._async_wake.set)
+            except RuntimeError:
+                pass  # Loop already closed
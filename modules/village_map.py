@@ -6,187 +6,482 @@ import re
 import json
 import os
 import time
-from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional
+import requests
+from bs4 import BeautifulSoup
 from selenium.webdriver.common.by import By
 from core.browser import BrowserManager
+from modules.buildings import BuildingManager
+from utils.helpers import safe_int
 from config import config
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+_LEVEL_RE = re.compile(r'Level\s*(\d+)')
+_GID_RE = re.compile(r'gid=(\d+)')
+
+# Resource field classes on dorf1.php, e.g. "gid4 buildingSlot1 level2"
+_SLOT_CLASS_RE = re.compile(r'buildingSlot(\d+)')
+_GID_CLASS_RE = re.compile(r'\bgid(\d+)')
+_LEVEL_CLASS_RE = re.compile(r'\blevel(\d+)')
+
+# Building type (gid) -> English name, for overview slots that carry no label
+_GID_NAMES = {gid: name for name, gid in BuildingManager.BUILDING_GIDS.items()}
+
+# Village ID in sidebar / URL query strings (newdid=, villageId= or did=)
+_VID_RE = re.compile(r'(?:newdid|villageId|did)=(\d+)')
+
+
+def _add_overview_rows(slots: Dict[int, Dict], rows: List[Dict], slot_range: range):
+    """Turn overview rows ({id, gid, name, level}) into slot info, keeping the first row per slot"""
+    for row in rows:
+        slot_id = row['id']
+        if slot_id not in slot_range or slot_id in slots:
+            continue
+        gid = row['gid'] or None
+        if gid:
+            name, level = row['name'] or _GID_NAMES.get(gid, 'Unknown'), row['level']
+        else:
+            name, level = 'Empty', 0
+        slots[slot_id] = {'slot': slot_id, 'name': name, 'level': level, 'gid': gid}
+
+
+def _class_num(regex: re.Pattern, classes: str) -> int:
+    """First number captured by regex in a class string (0 if none)"""
+    match = regex.search(classes)
+    return int(match.group(1)) if match else 0
+
+
+def _resource_rows(soup: BeautifulSoup) -> List[Dict]:
+    """Read every resource field ({id, gid, name, level}) from the village overview (dorf1.php)"""
+    rows = []
+    for f in soup.select('#resourceFieldContainer .resourceField, #resourceFieldContainer a[href*="build.php?id="]'):
+        classes = ' '.join(f.get('class', []))
+        label = f.select_one('.labelLayer')
+        href = f.get('href', '')
+        rows.append({
+            'id': (safe_int(f.get('data-aid')) or _class_num(_SLOT_CLASS_RE, classes)
+                   or safe_int(href.split('id=')[1] if 'id=' in href else None)),
+            'gid': safe_int(f.get('data-gid')) or _class_num(_GID_CLASS_RE, classes),
+            'name': '',
+            'level': _class_num(_LEVEL_CLASS_RE, classes) or safe_int(label.get_text(strip=True) if label else None),
+        })
+    return rows
+
+
+def _building_rows(soup: BeautifulSoup) -> List[Dict]:
+    """Read every building slot ({id, gid, name, level}) from the village center (dorf2.php)"""
+    rows = []
+    for s in soup.select('#villageContent .buildingSlot'):
+        level_el = s.select_one('[data-level]')
+        label = s.select_one('.labelLayer, .level')
+        name_el = s.select_one('.name')
+        if level_el:
+            level = level_el.get('data-level')
+        else:
+            level = label.get_text(strip=True) if label else None
+        rows.append({
+            'id': safe_int(s.get('data-aid')),
+            'gid': safe_int(s.get('data-gid')),
+            'name': (s.get('data-name') or (name_el.get_text() if name_el else '') or '').strip(),
+            'level': safe_int(level),
+        })
+    return rows
+
+
+def _village_name(soup: BeautifulSoup) -> str:
+    """Active village name from a game page ('' if not found)"""
+    elem = soup.select_one('#villageNameField') or soup.select_one('.villageList .active')
+    return elem.get_text(strip=True) if elem else ''
+
+
+def _active_village_id(soup: BeautifulSoup) -> Optional[str]:
+    """ID of the active sidebar village on a game page (None if not found)"""
+    active = soup.select_one('.villageList li.active')
+    if active is None:
+        return None
+    if active.get('data-did'):
+        return active['data-did']
+    link = active.select_one('a[href]')
+    match = _VID_RE.search(link['href']) if link else None
+    return match.group(1) if match else None
+
+
+def building_slots(page_source: str) -> List[Dict]:
+    """Read every building slot ({id, gid, name, level}) from dorf2.php page source"""
+    return _building_rows(BeautifulSoup(page_source, 'html.parser'))
+
+
+# Overview pages: (page, row parser, slot range it covers)
+_OVERVIEW_PAGES = [
+    ('dorf1.php', _resource_rows, range(1, 19)),
+    ('dorf2.php', _building_rows, range(19, 41)),
+]
+
 
 class VillageMap:
     """Scans and caches village building data for faster operations"""
 
     CACHE_FILE = 'village_cache.json'
+    SCAN_WORKERS = 8  # Concurrent build.php requests during a scan
 
     def __init__(self, browser: BrowserManager):
         self.browser = browser
         self.villages = {}  # village_name -> building data
         self.current_village = None
+        self._current_data: Optional[Dict] = None  # self.villages[current_village], once resolved
+        self._dirty = False  # self.villages changed since the last save
         self.load_cache()
 
     def load_cache(self):
         """Load cached village data from file"""
         try:
             if os.path.exists(self.CACHE_FILE):
-                with open(self.CACHE_FILE, 'r') as f:
-                    self.villages = json.load(f)
+                with open(self.CACHE_FILE, 'rb') as f:
+                    buf = f.read()
+                self.villages = orjson.loads(buf) if orjson else json.loads(buf)
+                # JSON turns the int slot keys into strings - restore them
+                for village in self.villages.values():
+                    for group in ('resource_fields', 'buildings'):
+                        village[group] = {int(k): v for k, v in village.get(group, {}).items()}
                 print(f"✓ Loaded cache for {len(self.villages)} village(s)")
         except:
             self.villages = {}
 
     def save_cache(self):
-        """Save village data to cache file"""
+        """Save village data to cache file (only if changed, atomically)"""
+        if not self._dirty:
+            return
+        tmp_file = f"{self.CACHE_FILE}.tmp"
         try:
-            with open(self.CACHE_FILE, 'w') as f:
-                json.dump(self.villages, f, indent=2)
+            if orjson:
+                data = orjson.dumps(self.villages, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+            else:
+                data = json.dumps(self.villages, indent=2).encode()
+            with open(tmp_file, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_file, self.CACHE_FILE)
+            self._dirty = False
         except:
             pass
 
     def get_current_village_name(self) -> str:
         """Get current village name"""
-        try:
-            elem = self.browser.find_element_fast(By.ID, 'villageNameField')
-            if elem:
-                return elem.text.strip()
-            elem = self.browser.find_element_fast(By.CSS_SELECTOR, '.villageList .active')
-            if elem:
-                return elem.text.strip()
-        except:
-            pass
-        return "Unknown"
+        return self.browser.first_text(['#villageNameField', '.villageList .active']) or "Unknown"
 
     def scan_village(self, force: bool = False) -> Dict:
         """Scan current village and cache building data"""
-        village_name = self.get_current_village_name()
+        overview = None
+        if force:
+            # A forced rescan reads the overview pages anyway - take the name from there
+            overview = self._parse_overview()
+            village_name = overview['name'] or self.get_current_village_name()
+        else:
+            village_name = self.get_current_village_name()
         self.current_village = village_name
 
         # Check if already cached
         if not force and village_name in self.villages:
             print(f"✓ Using cached data for '{village_name}'")
-            return self.villages[village_name]
+            self._current_data = self.villages[village_name]
+            return self._current_data
 
         print(f"\n🔍 Scanning village: {village_name}")
         print("=" * 40)
 
+        # Read both overview pages, then fetch whatever they missed slot by slot
+        if overview is None:
+            overview = self._parse_overview()
+        slots = overview['slots']
+        missing = [slot_id for slot_id in range(1, 41) if slot_id not in slots]
+        if missing:
+            slots.update(self._scan_slots(missing))
+
+        village_data = self._build_village_data(village_name, slots, verbose=True)
+
+        # Cache it
+        self.villages[village_name] = village_data
+        self._current_data = village_data
+        self._dirty = True
+        self.save_cache()
+
+        print(f"\n✓ Village scan complete!")
+        print(f"  Resource fields: {len(village_data['resource_fields'])}")
+        print(f"  Buildings: {len(village_data['buildings'])}")
+
+        return village_data
+
+    def scan_all_villages(self, villages: List[Dict]) -> int:
+        """Scan every village over plain HTTP in parallel (dorf1/dorf2 with newdid=)
+
+        villages: entries from MilitaryManager.get_all_villages(). Returns the number scanned.
+        The server's active village is switched back to the original one afterwards.
+        """
+        if not villages:
+            return 0
+
+        try:
+            session = self._http_session()
+        except Exception as e:
+            print(f"  HTTP scan unavailable: {e}")
+            return 0
+
+        # Every newdid= request switches the server's active village - remember where we were
+        original_id = self._fetch_active_village_id(session)
+
+        print(f"\n🔍 Scanning {len(villages)} village(s)...")
+        with ThreadPoolExecutor(max_workers=min(len(villages), self.SCAN_WORKERS)) as pool:
+            results = list(pool.map(lambda v: self._fetch_overview(session, v['id']), villages))
+
+        restored = False
+        if original_id:
+            try:
+                session.get(f"{config.base_url}/dorf1.php?newdid={original_id}", timeout=10).raise_for_status()
+                restored = True
+            except Exception as e:
+                print(f"  Could not switch back to the original village: {e}")
+
+        scanned = 0
+        for village, overview in zip(villages, results):
+            if not overview:
+                print(f"  ✗ {village['name']}: could not read overview")
+                continue
+            village_name = overview['name'] or village['name']
+            village_data = self._build_village_data(village_name, overview['slots'])
+            self.villages[village_name] = village_data
+            scanned += 1
+            print(f"  ✓ {village_name}: {len(village_data['resource_fields'])} fields, "
+                  f"{len(village_data['buildings'])} buildings")
+
+        if scanned:
+            self._dirty = True
+            self.save_cache()
+        if restored and self.current_village:
+            # Same village as before - point at its freshly scanned record
+            self._current_data = self.villages.get(self.current_village)
+        else:
+            # The server may no longer be in the village we had resolved
+            self.current_village = None
+            self._current_data = None
+
+        return scanned
+
+    def _build_village_data(self, village_name: str, slots: Dict[int, Dict], verbose: bool = False) -> Dict:
+        """Build the cached village record from slot info"""
         village_data = {
             'name': village_name,
             'scanned_at': time.strftime('%Y-%m-%d %H:%M:%S'),
             'resource_fields': {},  # slot 1-18
             'buildings': {},  # slot 19-40
-            'building_types': {}  # gid -> slot mapping
+            'building_types': {},  # str(gid) -> slot mapping
+            'name_index': {}  # lowercase name -> slot mapping
         }
 
-        # Scan resource fields (1-18)
-        print("Scanning resource fields (1-18)...")
+        # Resource fields (1-18)
+        if verbose:
+            print("Resource fields (1-18):")
         for slot_id in range(1, 19):
-            info = self._scan_slot(slot_id)
+            info = slots.get(slot_id)
             if info:
                 village_data['resource_fields'][slot_id] = info
-                print(f"  #{slot_id}: {info['name']} L{info['level']}")
+                if verbose:
+                    print(f"  #{slot_id}: {info['name']} L{info['level']}")
 
-        # Scan village buildings (19-40)
-        print("\nScanning village buildings (19-40)...")
+        # Village buildings (19-40)
+        if verbose:
+            print("\nVillage buildings (19-40):")
         for slot_id in range(19, 41):
-            info = self._scan_slot(slot_id)
+            info = slots.get(slot_id)
             if info and info['name'] != 'Unknown' and info['name'] != 'Empty':
                 village_data['buildings'][slot_id] = info
                 # Map building type (gid) to slot
                 if info.get('gid'):
-                    village_data['building_types'][info['gid']] = slot_id
-                print(f"  #{slot_id}: {info['name']} L{info['level']}")
+                    village_data['building_types'][str(info['gid'])] = slot_id
+                if verbose:
+                    print(f"  #{slot_id}: {info['name']} L{info['level']}")
 
-        # Cache it
-        self.villages[village_name] = village_data
-        self.save_cache()
-
-        print(f"\n✓ Village scan complete!")
-        print(f"  Resource fields: {len(village_data['resource_fields'])}")
-        print(f"  Buildings: {len(village_data['buildings'])}")
+        # Index names, buildings first so they win over same-named fields
+        for group in ('buildings', 'resource_fields'):
+            for slot_id, info in village_data[group].items():
+                village_data['name_index'].setdefault(info['name'].lower(), slot_id)
 
         return village_data
 
+    def _fetch_overview(self, session: requests.Session, village_id: str) -> Optional[Dict]:
+        """HTTP version of _parse_overview for any village (None if nothing was read)"""
+        def fetch_page(page: str) -> str:
+            response = session.get(f"{config.base_url}/{page}?newdid={village_id}", timeout=10)
+            response.raise_for_status()
+            return response.text
+
+        overview = self._read_overview(fetch_page)
+        return overview if overview['slots'] else None
+
+    def _fetch_active_village_id(self, session: requests.Session) -> Optional[str]:
+        """ID of the server's active village, read from a plain dorf1.php request (None if unknown)"""
+        try:
+            response = session.get(f"{config.base_url}/dorf1.php", timeout=10)
+            response.raise_for_status()
+        except Exception:
+            return None
+        return _active_village_id(BeautifulSoup(response.text, 'html.parser'))
+
+    def _parse_overview(self) -> Dict:
+        """Read all slots from dorf1.php (fields 1-18) and dorf2.php (buildings 19-40)
+
+        Returns {'name': village name ('' if not found), 'slots': {slot_id: info}}
+        """
+        def fetch_page(page: str) -> str:
+            self.browser.navigate_to(f"{config.base_url}/{page}")
+            return self.browser.get_page_source()
+
+        return self._read_overview(fetch_page)
+
+    def _read_overview(self, fetch_page: Callable[[str], str]) -> Dict:
+        """Parse both overview pages, fetching each page's HTML with fetch_page(page)"""
+        name = ''
+        slots = {}
+
+        for page, parse_rows, slot_range in _OVERVIEW_PAGES:
+            try:
+                soup = BeautifulSoup(fetch_page(page), 'html.parser')
+            except Exception:
+                continue
+            name = name or _village_name(soup)
+            _add_overview_rows(slots, parse_rows(soup), slot_range)
+
+        return {'name': name, 'slots': slots}
+
+    def _http_session(self) -> requests.Session:
+        """Build a requests session that reuses the browser's login cookies"""
+        session = requests.Session()
+        session.headers['User-Agent'] = self.browser.execute_script('return navigator.userAgent')
+        for cookie in self.browser.driver.get_cookies():
+            session.cookies.set(cookie['name'], cookie['value'],
+                                domain=cookie.get('domain'), path=cookie.get('path', '/'))
+        return session
+
+    def _scan_slots(self, slot_ids: Iterable[int]) -> Dict[int, Dict]:
+        """Scan many slots with concurrent HTTP requests (Selenium fallback per slot)"""
+        slot_ids = list(slot_ids)
+        results = {}
+
+        try:
+            session = self._http_session()
+            with ThreadPoolExecutor(max_workers=self.SCAN_WORKERS) as pool:
+                for slot_id, info in zip(slot_ids, pool.map(lambda sid: self._fetch_slot(session, sid), slot_ids)):
+                    if info:
+                        results[slot_id] = info
+        except Exception as e:
+            print(f"  HTTP scan unavailable ({e}), using browser")
+
+        # Anything the HTTP scan missed goes through the browser
+        for slot_id in slot_ids:
+            if slot_id not in results:
+                info = self._scan_slot(slot_id)
+                if info:
+                    results[slot_id] = info
+
+        return results
+
+    def _fetch_slot(self, session: requests.Session, slot_id: int) -> Optional[Dict]:
+        """Scan a single building slot over plain HTTP"""
+        try:
+            response = session.get(f"{config.base_url}/build.php?id={slot_id}", timeout=10)
+            response.raise_for_status()
+            h1 = BeautifulSoup(response.text, 'html.parser').select_one('h1.titleInHeader')
+            title = h1.get_text(' ', strip=True) if h1 else ''
+            return self._parse_slot(slot_id, title, response.url)
+        except Exception:
+            return None
+
     def _scan_slot(self, slot_id: int) -> Optional[Dict]:
-        """Scan a single building slot"""
+        """Scan a single building slot in the browser"""
         try:
             self.browser.navigate_to(f"{config.base_url}/build.php?id={slot_id}")
 
-            info = {
-                'slot': slot_id,
-                'name': 'Unknown',
-                'level': 0,
-                'gid': None
-            }
-
             # Get building name and level from h1
             h1 = self.browser.find_element_fast(By.CSS_SELECTOR, 'h1.titleInHeader')
-            if h1:
-                text = h1.text
-                if 'Level' in text:
-                    info['name'] = text.split('Level')[0].strip()
-                    match = re.search(r'Level\s*(\d+)', text)
-                    if match:
-                        info['level'] = int(match.group(1))
-                elif text.strip():
-                    info['name'] = text.strip()
-
-            # Try to get gid from URL or page
-            url = self.browser.current_url
-            gid_match = re.search(r'gid=(\d+)', url)
-            if gid_match:
-                info['gid'] = int(gid_match.group(1))
-
-            # Check if empty slot
-            if 'construct' in url.lower() or info['name'] == 'Unknown':
-                info['name'] = 'Empty'
-                info['level'] = 0
-
-            return info
+            return self._parse_slot(slot_id, h1.text if h1 else '', self.browser.current_url)
 
         except:
             return None
 
+    def _parse_slot(self, slot_id: int, text: str, url: str) -> Dict:
+        """Build slot info from a build.php page title and URL"""
+        info = {
+            'slot': slot_id,
+            'name': 'Unknown',
+            'level': 0,
+            'gid': None
+        }
+
+        if 'Level' in text:
+            info['name'] = text.split('Level')[0].strip()
+            match = _LEVEL_RE.search(text)
+            if match:
+                info['level'] = int(match.group(1))
+        elif text.strip():
+            info['name'] = text.strip()
+
+        # Try to get gid from URL
+        gid_match = _GID_RE.search(url)
+        if gid_match:
+            info['gid'] = int(gid_match.group(1))
+
+        # Check if empty slot
+        if 'construct' in url.lower() or info['name'] == 'Unknown':
+            info['name'] = 'Empty'
+            info['level'] = 0
+
+        return info
+
+    def _get_current_data(self) -> Dict:
+        """Get the current village's cached data, scanning it on first use"""
+        if self._current_data is None:
+            if not self.current_village or self.current_village not in self.villages:
+                self.scan_village()
+            self._current_data = self.villages.get(self.current_village, {})
+        return self._current_data
+
     def get_building_slot(self, building_name: str) -> Optional[int]:
         """Get slot ID for a building by name (uses cache)"""
-        if not self.current_village or self.current_village not in self.villages:
-            self.scan_village()
-
-        village = self.villages.get(self.current_village, {})
+        village = self._get_current_data()
         name_lower = building_name.lower()
 
+        # Exact name match
+        slot_id = village.get('name_index', {}).get(name_lower)
+        if slot_id is not None:
+            return slot_id
+
         # Check village buildings
         for slot_id, info in village.get('buildings', {}).items():
             if name_lower in info['name'].lower():
-                return int(slot_id)
+                return slot_id
 
         # Check resource fields
         for slot_id, info in village.get('resource_fields', {}).items():
             if name_lower in info['name'].lower():
-                return int(slot_id)
+                return slot_id
 
         return None
 
     def get_building_by_gid(self, gid: int) -> Optional[int]:
         """Get slot ID for a building by type (gid)"""
-        if not self.current_village or self.current_village not in self.villages:
-            self.scan_village()
-
-        village = self.villages.get(self.current_village, {})
-        return village.get('building_types', {}).get(str(gid))
+        return self._get_current_data().get('building_types', {}).get(str(gid))
 
     def get_resource_fields(self) -> Dict:
         """Get all resource fields (uses cache)"""
-        if not self.current_village or self.current_village not in self.villages:
-            self.scan_village()
-
-        village = self.villages.get(self.current_village, {})
-        return village.get('resource_fields', {})
+        return self._get_current_data().get('resource_fields', {})
 
     def get_buildings(self) -> Dict:
         """Get all village buildings (uses cache)"""
-        if not self.current_village or self.current_village not in self.villages:
-            self.scan_village()
-
-        village = self.villages.get(self.current_village, {})
-        return village.get('buildings', {})
+        return self._get_current_data().get('buildings', {})
 
     def get_fields_by_type(self, field_type: str) -> List[Dict]:
         """Get all fields of a specific type (e.g., 'Cropland', 'Clay Pit')"""
@@ -195,7 +490,7 @@ class VillageMap:
 
         for slot_id, info in self.get_resource_fields().items():
             if type_lower in info['name'].lower():
-                fields.append({'slot': int(slot_id), **info})
+                fields.append({'slot': slot_id, **info})
 
         return fields
 
@@ -208,7 +503,7 @@ class VillageMap:
             if field_type and field_type.lower() not in info['name'].lower():
                 continue
             if lowest is None or info['level'] < lowest['level']:
-                lowest = {'slot': int(slot_id), **info}
+                lowest = {'slot': slot_id, **info}
 
         return lowest
 
@@ -217,11 +512,24 @@ class VillageMap:
         if village_name:
             if village_name in self.villages:
                 del self.villages[village_name]
+                self._dirty = True
         else:
             self.villages = {}
+            self._dirty = True
+        self._current_data = None
         self.save_cache()
         print("✓ Cache cleared")
 
+    def set_current_village(self, village_name: str):
+        """Record that the browser is now in village_name (e.g. after a switch)"""
+        if village_name != self.current_village:
+            self.current_village = village_name
+            self._current_data = None
+
+    def invalidate(self):
+        """Forget the resolved current-village data (call after replacing self.villages)"""
+        self._current_data = None
+
     def print_summary(self):
         """Print village summary"""
         if not self.current_village or self.current_village not in self.villages:
@@ -235,9 +543,9 @@ class VillageMap:
         print(f"{'='*50}")
 
         print("\nResource Fields:")
-        for slot_id, info in sorted(village.get('resource_fields', {}).items(), key=lambda x: int(x[0])):
+        for slot_id, info in sorted(village.get('resource_fields', {}).items()):
             print(f"  #{slot_id:2}: {info['name']:<15} L{info['level']}")
 
         print("\nBuildings:")
-        for slot_id, info in sorted(village.get('buildings', {}).items(), key=lambda x: int(x[0])):
+        for slot_id, info in sorted(village.get('buildings', {}).items()):
             print(f"  #{slot_id:2}: {info['name']:<20} L{info['level']}")
@@ -1,14 +1,92 @@
 import os
+import re
 import time
+import random
+import queue
+import atexit
 import logging
+import functools
 from datetime import datetime, timedelta
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
 
 # Create logs directory
 LOGS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'logs')
 os.makedirs(LOGS_DIR, exist_ok=True)
 
+# Console emoji prefixes for the Logger wrappers
+_P_INFO = "ℹ️  "
+_P_SUCCESS = "✓ "
+_P_WARNING = "⚠️  "
+_P_ERROR = "✗ "
+_P_CRITICAL = "🔥 "
+_P_ACTION = "🔧 "
+_P_RESOURCE = "📊 "
+_P_MILITARY = "⚔️  "
+_P_AI = "🤖 "
+
+# "1:02:03" or "02:03" -> (hours or None, minutes, seconds)
+_HMS_RE = re.compile(r'(?:(\d+):)?(\d+):(\d+)$')
+
+
+class SizeTrackingRotatingFileHandler(RotatingFileHandler):
+    """RotatingFileHandler that counts bytes written instead of asking the file each record"""
+
+    def __init__(self, filename, *args, **kwargs):
+        super().__init__(filename, *args, **kwargs)
+        self._bytes_written = os.path.getsize(self.baseFilename) if os.path.exists(self.baseFilename) else 0
+
+    def emit(self, record):
+        try:
+            # Format once; the file is measured in encoded bytes, like maxBytes
+            msg = self.format(record) + self.terminator
+            size = len(msg.encode(self.encoding or 'utf-8'))
+            if self.maxBytes > 0 and self._bytes_written and self._bytes_written + size >= self.maxBytes:
+                self.doRollover()
+                self._bytes_written = 0
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(msg)
+            self.flush()
+            self._bytes_written += size
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+
+class _FileQueueHandler(QueueHandler):
+    """Queues records for the shared file listener, tagged with this logger's file handler"""
+
+    def __init__(self, log_queue, file_handler: logging.Handler):
+        super().__init__(log_queue)
+        self.file_handler = file_handler
+
+    def prepare(self, record):
+        record = super().prepare(record)
+        record.file_handler = self.file_handler
+        return record
+
+
+class _FileRouter(logging.Handler):
+    """Hands each queued record to the file handler it was tagged with"""
+
+    def handle(self, record):
+        file_handler = record.__dict__.pop('file_handler', None)
+        if file_handler is not None and record.levelno >= file_handler.level:
+            file_handler.handle(record)
+        return file_handler is not None
+
+
+@functools.lru_cache(maxsize=None)
+def _file_log_queue() -> queue.SimpleQueue:
+    """Queue drained by the one background thread that writes every log file"""
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, _FileRouter(), respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)  # Flush anything still queued on exit
+    return log_queue
+
 
 def setup_logger(name: str = 'travian_bot', log_file: str = None) -> logging.Logger:
     """
@@ -21,6 +99,12 @@ def setup_logger(name: str = 'travian_bot', log_file: str = None) -> logging.Log
     Returns:
         Configured logger instance
     """
+    return _build_logger(name, log_file)
+
+
+@functools.lru_cache(maxsize=None)
+def _build_logger(name: str, log_file: str = None) -> logging.Logger:
+    """Build the logger for setup_logger - runs once per (name, log_file)"""
     logger = logging.getLogger(name)
 
     # Avoid adding handlers multiple times
@@ -44,7 +128,7 @@ def setup_logger(name: str = 'travian_bot', log_file: str = None) -> logging.Log
         log_file = f"{name}_{datetime.now().strftime('%Y%m%d')}.log"
 
     file_path = os.path.join(LOGS_DIR, log_file)
-    file_handler = RotatingFileHandler(
+    file_handler = SizeTrackingRotatingFileHandler(
         file_path,
         maxBytes=5*1024*1024,  # 5MB
         backupCount=5,
@@ -53,15 +137,15 @@ def setup_logger(name: str = 'travian_bot', log_file: str = None) -> logging.Log
     file_handler.setLevel(logging.DEBUG)
     file_handler.setFormatter(file_formatter)
 
-    # Console handler
+    # Console handler - stays synchronous so output keeps its order with print()
     console_handler = logging.StreamHandler()
     console_handler.setLevel(logging.INFO)
     console_handler.setFormatter(console_formatter)
-
-    # Add handlers
-    logger.addHandler(file_handler)
     logger.addHandler(console_handler)
 
+    # File writes are only enqueued here - the shared background listener does the I/O
+    logger.addHandler(_FileQueueHandler(_file_log_queue(), file_handler))
+
     return logger
 
 
@@ -92,49 +176,49 @@ class Logger:
 
     @classmethod
     def info(cls, message: str):
-        cls._get_logger().info(f"ℹ️  {message}")
+        cls._get_logger().info("%s%s", _P_INFO, message)
 
     @classmethod
     def success(cls, message: str):
-        cls._get_logger().info(f"✓ {message}")
+        cls._get_logger().info("%s%s", _P_SUCCESS, message)
 
     @classmethod
     def warning(cls, message: str):
-        cls._get_logger().warning(f"⚠️  {message}")
+        cls._get_logger().warning("%s%s", _P_WARNING, message)
 
     @classmethod
     def error(cls, message: str):
-        cls._get_logger().error(f"✗ {message}")
+        cls._get_logger().error("%s%s", _P_ERROR, message)
 
     @classmethod
     def critical(cls, message: str):
-        cls._get_logger().critical(f"🔥 {message}")
+        cls._get_logger().critical("%s%s", _P_CRITICAL, message)
 
     @classmethod
     def action(cls, message: str):
         """Log an action being performed"""
-        cls._get_logger().info(f"🔧 {message}")
+        cls._get_logger().info("%s%s", _P_ACTION, message)
 
     @classmethod
     def resource(cls, message: str):
         """Log resource updates"""
-        cls._get_logger().info(f"📊 {message}")
+        cls._get_logger().info("%s%s", _P_RESOURCE, message)
 
     @classmethod
     def military(cls, message: str):
         """Log military actions"""
-        cls._get_logger().info(f"⚔️  {message}")
+        cls._get_logger().info("%s%s", _P_MILITARY, message)
 
     @classmethod
     def ai(cls, message: str):
         """Log AI-related actions"""
-        cls._get_logger().info(f"🤖 {message}")
+        cls._get_logger().info("%s%s", _P_AI, message)
 
     @classmethod
     def log_separator(cls, title: str = ""):
         """Log a visual separator"""
         if title:
-            cls._get_logger().info(f"{'='*20} {title} {'='*20}")
+            cls._get_logger().info("%s %s %s", '=' * 20, title, '=' * 20)
         else:
             cls._get_logger().info("=" * 50)
 
@@ -147,60 +231,59 @@ class ActionLogger:
 
     def log_upgrade(self, building_name: str, from_level: int, to_level: int, success: bool):
         status = "SUCCESS" if success else "FAILED"
-        self.logger.info(f"UPGRADE | {status} | {building_name} | L{from_level} -> L{to_level}")
+        self.logger.info("UPGRADE | %s | %s | L%s -> L%s", status, building_name, from_level, to_level)
 
     def log_train(self, troop_type: str, amount: int, success: bool):
         status = "SUCCESS" if success else "FAILED"
-        self.logger.info(f"TRAIN | {status} | {troop_type} x{amount}")
+        self.logger.info("TRAIN | %s | %s x%s", status, troop_type, amount)
 
     def log_attack(self, target_x: int, target_y: int, troops: dict, success: bool):
         status = "SUCCESS" if success else "FAILED"
-        self.logger.info(f"ATTACK | {status} | ({target_x},{target_y}) | {troops}")
+        self.logger.info("ATTACK | %s | (%s,%s) | %s", status, target_x, target_y, troops)
 
     def log_resources(self, resources: dict, production: dict):
-        self.logger.info(f"RESOURCES | wood={resources.get('wood',0)} clay={resources.get('clay',0)} iron={resources.get('iron',0)} crop={resources.get('crop',0)}")
-        self.logger.info(f"PRODUCTION | wood={production.get('wood',0)}/h clay={production.get('clay',0)}/h iron={production.get('iron',0)}/h crop={production.get('crop',0)}/h")
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
+        self.logger.info("RESOURCES | wood=%s clay=%s iron=%s crop=%s",
+                         resources.get('wood', 0), resources.get('clay', 0),
+                         resources.get('iron', 0), resources.get('crop', 0))
+        self.logger.info("PRODUCTION | wood=%s/h clay=%s/h iron=%s/h crop=%s/h",
+                         production.get('wood', 0), production.get('clay', 0),
+                         production.get('iron', 0), production.get('crop', 0))
 
     def log_login(self, username: str, success: bool):
         status = "SUCCESS" if success else "FAILED"
-        self.logger.info(f"LOGIN | {status} | {username}")
+        self.logger.info("LOGIN | %s | %s", status, username)
 
     def log_cycle(self, cycle_num: int, actions_taken: list):
-        self.logger.info(f"CYCLE | #{cycle_num} | Actions: {', '.join(actions_taken) if actions_taken else 'None'}")
+        if self.logger.isEnabledFor(logging.INFO):
+            self.logger.info("CYCLE | #%s | Actions: %s", cycle_num, ', '.join(actions_taken) if actions_taken else 'None')
 
     def log_error(self, action: str, error: str):
-        self.logger.error(f"ERROR | {action} | {error}")
+        self.logger.error("ERROR | %s | %s", action, error)
 
     def log_incoming_attack(self, attacker: str, arrival_time: str):
-        self.logger.warning(f"INCOMING | {attacker} | Arrival: {arrival_time}")
+        self.logger.warning("INCOMING | %s | Arrival: %s", attacker, arrival_time)
 
 
 def format_time(seconds: int) -> str:
     """Format seconds into human-readable time"""
     if seconds < 60:
         return f"{seconds}s"
-    elif seconds < 3600:
-        minutes = seconds // 60
-        secs = seconds % 60
-        return f"{minutes}m {secs}s"
-    else:
-        hours = seconds // 3600
-        minutes = (seconds % 3600) // 60
+    hours, rem = divmod(seconds, 3600)
+    minutes, secs = divmod(rem, 60)
+    if hours:
         return f"{hours}h {minutes}m"
+    return f"{minutes}m {secs}s"
 
 
 def parse_travian_time(time_str: str) -> int:
-    """Parse Travian time format to seconds"""
-    try:
-        parts = time_str.split(':')
-        if len(parts) == 3:
-            hours, minutes, seconds = map(int, parts)
-            return hours * 3600 + minutes * 60 + seconds
-        elif len(parts) == 2:
-            minutes, seconds = map(int, parts)
-            return minutes * 60 + seconds
-    except:
+    """Parse Travian time format (H:MM:SS or MM:SS) to seconds, 0 if unparseable"""
+    match = _HMS_RE.match(time_str.strip()) if time_str else None
+    if not match:
         return 0
+    hours, minutes, seconds = match.groups(default='0')
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
 
 
 def calculate_arrival_time(duration_seconds: int) -> datetime:
@@ -210,13 +293,14 @@ def calculate_arrival_time(duration_seconds: int) -> datetime:
 
 def random_delay(min_seconds: float = 0.5, max_seconds: float = 2.0):
     """Add a random delay to avoid detection"""
-    import random
     delay = random.uniform(min_seconds, max_seconds)
     time.sleep(delay)
 
 
 def safe_int(value, default: int = 0) -> int:
     """Safely convert value to int"""
+    if type(value) is int:
+        return value
     try:
         return int(value)
     except (ValueError, TypeError):
@@ -225,6 +309,8 @@ def safe_int(value, default: int = 0) -> int:
 
 def safe_float(value, default: float = 0.0) -> float:
     """Safely convert value to float"""
+    if type(value) is float:
+        return value
     try:
         return float(value)
     except (ValueError, TypeError):